@@ -1,13 +1,16 @@
 from .custom_prompt_manager import CharacterPromptGenerator
 from .scene_prompt_node import ScenePromptNode
+from .watermark_node import WatermarkLogoNode
 
 # Node registration for ComfyUI
 NODE_CLASS_MAPPINGS = {
     "CharacterPromptGenerator": CharacterPromptGenerator,
-    "ScenePromptNode": ScenePromptNode
+    "ScenePromptNode": ScenePromptNode,
+    "WatermarkLogoNode": WatermarkLogoNode
 }
 
 NODE_DISPLAY_NAME_MAPPINGS = {
     "CharacterPromptGenerator": "packreator manager",
-    "ScenePromptNode": "Scene Prompt Generator 🎨"
+    "ScenePromptNode": "Scene Prompt Generator 🎨",
+    "WatermarkLogoNode": "Watermark Logo (cached)"
 }
\ No newline at end of file
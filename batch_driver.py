@@ -0,0 +1,259 @@
+"""
+Headless batch generation of pack prompts.
+
+Runs the same node code as a ComfyUI graph in which ScenePromptNode feeds
+CharacterPromptGenerator (character -> character_name, characterTags ->
+character_base, scenePrompt -> prompt_scenes, one call per scene), for every
+item of a manifest, across a pool of processes. Each item has a fixed seed,
+so a run reproduces the graph's output for the same inputs.
+
+Results are appended to a JSONL file as items complete; restarting with the
+same output file skips the items already written. Items that failed, or whose
+character lookup fell back to placeholder tags because every scrape failed,
+are recorded with an "error" and generated again on restart.
+
+Manifest (JSON):
+    {
+      "seed": 0,
+      "defaults": {"workspace": "runpod", "batch_size": 20, "middle_count": 10},
+      "items": [
+        {"organization": ["lovehent", "vixmavis"], "project_type": "pack",
+         "character": ["2b_(nier:automata)", "hatsune_miku"]},
+        {"organization": "violetjoi", "project_type": "extra", "seed": 42}
+      ]
+    }
+Item fields are the inputs of both nodes (characterName/character_name are
+set from "character"; an empty character draws a random one). A list in
+"character", "organization" or "project_type" expands the item into one
+item per combination. Items without "seed" get one derived from the
+manifest seed and the item id.
+
+Run from the directory that contains the node pack:
+    python -m Packreator_manager.batch_driver manifest.json --output pack.jsonl [--workers 4]
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Union
+
+from .custom_prompt_manager import CharacterPromptGenerator
+from .scene_prompt_node import ScenePromptNode
+
+# Expanded into one item per value when given as a list
+EXPANDED_FIELDS = ("character", "organization", "project_type")
+
+DEFAULTS = {
+    # ScenePromptNode
+    "start_count": 5,
+    "middle_count": 10,
+    "end_count": 3,
+    "partner_text": "",
+    "character": "",
+    "characterTags": "",
+    "batch_size": 1,
+    # CharacterPromptGenerator
+    "organization": "teste",
+    "project_type": "pack",
+    "workspace": "runpod",
+    "character_scene_details": "",
+    "background": "",
+    "final_details_quality_tags": "",
+    "max_prompts_enabled": "no",
+    "max_prompts": 250,
+}
+
+MAX_SEED = 9999999999  # Largest seed accepted by ScenePromptNode
+
+
+def item_seed(base_seed: int, item_id: str) -> int:
+    """Stable seed of an item, independent of its position in the manifest."""
+    digest = hashlib.blake2b(f"{base_seed}:{item_id}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % (MAX_SEED + 1)
+
+
+def expand_manifest(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Turn a manifest into the list of items to generate, with defaults, ids and seeds filled in.
+
+    Ids are built from organization, project type and character, numbered when
+    the same combination appears more than once, so they stay the same when
+    other items are added or removed.
+    """
+    defaults = {**DEFAULTS, **manifest.get("defaults", {})}
+    base_seed = int(manifest.get("seed", 0))
+    items = []
+    occurrences: Dict[str, int] = {}
+    for entry in manifest.get("items", [{}]):
+        entry = {**defaults, **entry}
+        choices = [entry[field] if isinstance(entry[field], list) else [entry[field]] for field in EXPANDED_FIELDS]
+        for values in itertools.product(*choices):
+            item = {**entry, **dict(zip(EXPANDED_FIELDS, values))}
+            if item.get("novelty_project"):
+                raise ValueError("novelty_project is not supported in batches: "
+                                 "the worker processes would overwrite each other's used-line sets")
+            if "id" not in item:
+                key = f"{item['organization']}/{item['project_type']}/{item['character'] or '*'}"
+                occurrences[key] = occurrences.get(key, 0) + 1
+                item["id"] = f"{key}#{occurrences[key]}"
+            if "seed" not in item:
+                item["seed"] = item_seed(base_seed, item["id"])
+            items.append(item)
+    ids = [item["id"] for item in items]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Duplicate item ids in manifest")
+    return items
+
+
+_scene_node: Optional[ScenePromptNode] = None
+_prompt_node: Optional[CharacterPromptGenerator] = None
+
+
+def _init_worker(rate: Optional[float] = None) -> None:
+    global _scene_node, _prompt_node
+    if rate is not None:
+        # Read by the scraper when it is loaded; the pool shares the overall rate
+        os.environ["DANBOORU_RATE"] = str(rate)
+    _scene_node = ScenePromptNode()
+    _prompt_node = CharacterPromptGenerator()
+
+
+def run_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Generate every scene of an item with the node code.
+
+    Returns:
+        The output record: the item id, seed and inputs plus one entry per scene
+        with the outputs of both nodes, or an "error" entry if generation failed
+        or a scene got the placeholder character tags
+    """
+    if _scene_node is None:
+        _init_worker()
+    record = {"id": item["id"], "seed": item["seed"], "organization": item["organization"],
+              "project_type": item["project_type"], "character": item["character"]}
+    started = time.monotonic()
+    try:
+        # The node without its memo, which also says whether every character lookup succeeded
+        (characters, character_tags, scene_prompts), complete = _scene_node._generate(
+            item["start_count"], item["middle_count"], item["end_count"], item["partner_text"], item["seed"],
+            item["character"], item["characterTags"], item["batch_size"])
+        if not complete:
+            raise LookupError("character tags fell back to placeholders (every scrape failed)")
+        scenes = []
+        for character, tags, scene_prompt in zip(characters, character_tags, scene_prompts):
+            outputs = _prompt_node.generate_prompts(
+                item["organization"], item["project_type"], item["workspace"], character, tags,
+                item["character_scene_details"], item["background"], item["final_details_quality_tags"],
+                scene_prompt, item["max_prompts_enabled"], item["max_prompts"])
+            scenes.append({"character": character, "characterTags": tags, "scenePrompt": scene_prompt,
+                           **dict(zip(CharacterPromptGenerator.RETURN_NAMES, outputs))})
+        record["scenes"] = scenes
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.monotonic() - started, 3)
+    return record
+
+
+def completed_ids(path: Union[str, Path]) -> Set[str]:
+    """
+    Ids of the items already written to an output file (failed items excluded).
+
+    A last line cut short by an interrupted run is removed from the file.
+    """
+    path = Path(path)
+    done: Set[str] = set()
+    if not path.exists():
+        return done
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "error" in record:
+            done.discard(record["id"])
+        else:
+            done.add(record["id"])
+    return done
+
+
+def run_batch(items: List[Dict[str, Any]], output: Union[str, Path], workers: int = 4,
+              rate: Optional[float] = None, progress_every: float = 5.0) -> Dict[str, int]:
+    """
+    Generate items across a process pool, appending each record to output as it completes.
+
+    Args:
+        items: Items from expand_manifest
+        output: JSONL file; items already in it are skipped
+        workers: Number of worker processes
+        rate: Danbooru requests per second for the whole pool, split evenly
+            between the workers (default: DANBOORU_RATE or 4, as for one process)
+        progress_every: Seconds between progress lines on stderr
+
+    Returns:
+        Counters of generated, failed and skipped items
+    """
+    output = Path(output)
+    done = completed_ids(output)
+    pending = [item for item in items if item["id"] not in done]
+    stats = {"generated": 0, "failed": 0, "skipped": len(items) - len(pending)}
+    if not pending:
+        return stats
+    workers = max(1, min(workers, len(pending)))
+    if rate is None:
+        rate = float(os.environ.get("DANBOORU_RATE", "4"))
+    worker_rate = rate / workers
+    started = last_report = time.monotonic()
+    scenes = 0
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(worker_rate,)) as pool:
+        futures = [pool.submit(run_item, item) for item in pending]
+        for count, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in record:
+                stats["failed"] += 1
+                print(f"{record['id']}: {record['error']}", file=sys.stderr)
+            else:
+                stats["generated"] += 1
+                scenes += len(record["scenes"])
+            now = time.monotonic()
+            if now - last_report >= progress_every or count == len(pending):
+                last_report = now
+                elapsed = now - started
+                rate_items = count / elapsed
+                eta = (len(pending) - count) / rate_items if rate_items else 0.0
+                print(f"{count}/{len(pending)} items, {rate_items:.2f} items/s, {scenes / elapsed:.1f} scenes/s, "
+                      f"ETA {eta:.0f} s", file=sys.stderr)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSON manifest of the items to generate")
+    parser.add_argument("--output", required=True, help="JSONL file to append results to (resumed if it exists)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--rate", type=float, default=None, help="Danbooru requests per second for all workers")
+    args = parser.parse_args(argv)
+
+    with open(args.manifest, "r", encoding="utf-8") as f:
+        items = expand_manifest(json.load(f))
+    started = time.monotonic()
+    stats = run_batch(items, args.output, workers=args.workers, rate=args.rate)
+    print(", ".join(f"{k}: {v}" for k, v in stats.items()) + f" in {time.monotonic() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the BeautifulSoup and streaming parser paths of the Danbooru scraper
+on saved posts pages.
+
+Run from the directory that contains the node pack:
+    python -m Packreator_manager.benchmarks.bench_scraper_parse [--pages 3] [--repeat 20]
+"""
+import argparse
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from ..scraper_client import load_scraper
+
+FIXTURES = Path(__file__).parent / "fixtures"
+SCRAPER = Path(__file__).parent.parent / "files" / "danbooru_scraper.py"
+CHARACTER = "2b_(nier:automata)"
+
+
+def soup_path(scraper, pages):
+    """Old path: full DOM per page, flattened tag list, then process_tags."""
+    tags_raw = []
+    for html in pages:
+        soup = BeautifulSoup(html, "lxml")
+        tags_raw.extend(art["data-tags"] for art in soup.select("div.posts-container.gap-2 > article"))
+    return scraper.process_tags(tags_raw, CHARACTER)
+
+
+def stream_path(scraper, pages):
+    """Streaming path: event-driven parse of byte chunks, counts merged per page."""
+    counts = scraper.TagCounts()
+    for html in pages:
+        chunks = (html[i:i + scraper.CHUNK_SIZE] for i in range(0, len(html), scraper.CHUNK_SIZE))
+        counts.merge(scraper.count_data_tags(chunks))
+    return scraper.process_counts(counts.counter, counts.posts, CHARACTER)
+
+
+def best_of(fn, repeat):
+    """Return the fastest of repeat runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3, help="posts pages per character")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    scraper = load_scraper(SCRAPER)
+    fixtures = sorted(FIXTURES.glob("danbooru_posts_*.html"))
+    pages = [fixtures[i % len(fixtures)].read_bytes() for i in range(args.pages)]
+
+    expected = soup_path(scraper, pages)
+    actual = stream_path(scraper, pages)
+    if expected != actual:
+        raise SystemExit(f"streaming parser mismatch:\n  soup:   {expected}\n  stream: {actual}")
+
+    soup_time = best_of(lambda: soup_path(scraper, pages), args.repeat)
+    stream_time = best_of(lambda: stream_path(scraper, pages), args.repeat)
+    size_kb = sum(len(p) for p in pages) / 1024
+    print(f"{args.pages} pages, {size_kb:.0f} KB, outputs match")
+    print(f"soup   {soup_time * 1000:8.2f} ms")
+    print(f"stream {stream_time * 1000:8.2f} ms  ({soup_time / stream_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
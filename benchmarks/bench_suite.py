@@ -0,0 +1,600 @@
+"""
+Time the hot paths of the node pack offline and save the results as JSON.
+
+Covers CharacterPromptGenerator.generate_prompts (and, on the same seeded
+scenes, the size of its prompts against the string concatenation the tag
+assembler replaced), the PromptSceneGenerator
+line selection, clothing enhancement and full scene generation, the
+loading of a large corpus into a tuple or a memory-mapped line index
+(with the peak Python memory of each), getting a watermark logo ready per
+image with and without WatermarkCache, re-selecting the tags of many
+characters from stored counts with process_all against process_counts per
+character, and the scraper's
+scrape_page/scrape_page_json/process_tags. The scraper reads the recorded
+pages in benchmarks/fixtures from a local stub HTTP server (the JSON
+fixture holds the tag strings of the same posts as the HTML one), and the
+scene generator runs on a scaled copy of files/ with a pre-filled tag
+cache, so nothing touches the network. The faults suite runs concurrent scrapes against a
+stub that injects 429 and 503 responses, recording requests, peak request
+rate and breaker state next to the wall time of each scenario.
+
+Run from the directory that contains the node pack:
+    python -m Packreator_manager.benchmarks.bench_suite run [--quick] [--output results.json]
+    python -m Packreator_manager.benchmarks.bench_suite compare base.json head.json [--threshold 0.10]
+
+Results are written to benchmarks/results/<commit>.json by default. The
+suites only time; the correctness checks they rely on live in tests/
+(python -m pytest).
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from PIL import Image
+
+from .. import prompt_scene_generator
+from ..corpus_cache import _read_lines
+from ..custom_prompt_manager import CharacterPromptGenerator
+from ..line_index import MappedLines, index_path
+from ..line_sampler import LineSampler
+from ..novelty import ProjectNovelty
+from ..prompt_scene_generator import PromptSceneGenerator
+from ..scraper_client import load_scraper
+from ..tag_cache import CharacterTagCache
+from ..tag_counts import TagCountStore, process_all
+from ..watermark_cache import COMMON_RESOLUTIONS, WatermarkCache, fit_size
+
+ROOT = Path(__file__).parent.parent
+FILES = ROOT / "files"
+FIXTURES = Path(__file__).parent / "fixtures"
+RESULTS = Path(__file__).parent / "results"
+CHARACTER = "2b_(nier:automata)"
+CHARACTER_TAGS = "1girl, white_hair, short_hair, black_dress, juliet_sleeves, blindfold, mole_under_mouth"
+
+SIZES = {
+    "full": {"corpus": [1, 10, 50], "segments": [10, 250, 1000, 5000], "batch": [1, 16, 128], "pages": [1, 3, 6],
+             "concurrent": 8, "lines": [2_000_000], "scenes": 200, "characters": [4000]},
+    "quick": {"corpus": [1, 10], "segments": [10, 1000], "batch": [1, 16], "pages": [1, 3], "concurrent": 4,
+              "lines": [200_000], "scenes": 50, "characters": [500]},
+}
+
+
+def measure(fn, repeat, number=1):
+    """Run fn number times per sample; return best and median seconds per call."""
+    fn()  # Warm up caches and connections
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {"best": min(samples), "median": statistics.median(samples), "repeat": repeat, "number": number}
+
+
+def peak_memory(fn):
+    """Peak Python memory in MB allocated while running fn once."""
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1e6, 1)
+    finally:
+        tracemalloc.stop()
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    """Serves the recorded posts pages in turn, whatever the query; /posts.json serves the JSON fixture."""
+    pages = []
+    json_page = b"[]"
+    _next = 0
+    _lock = threading.Lock()
+
+    def do_GET(self):
+        content_type = "text/html; charset=utf-8"
+        if self.path.startswith("/posts.json"):
+            body, content_type = self.json_page, "application/json"
+            if "tags=__error__" in self.path:
+                body = b'{"success": false, "error": "PostQuery::TagLimitError", "message": "stub error"}'
+
+        else:
+            with self._lock:
+                body = self.pages[_FixtureHandler._next % len(self.pages)]
+                _FixtureHandler._next += 1
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _FaultyHandler(_FixtureHandler):
+    """Like _FixtureHandler, but answers 429 or 503 with the configured odds and logs every request."""
+    p429 = 0.0
+    p503 = 0.0
+    statuses = Counter()
+    times = []
+    rng = random.Random(0)
+
+    def do_GET(self):
+        with self._lock:
+            roll = self.rng.random()
+            status = 429 if roll < self.p429 else 503 if roll < self.p429 + self.p503 else 200
+            self.statuses[status] += 1
+            self.times.append(time.monotonic())
+        if status == 200:
+            return super().do_GET()
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Length", "4")
+        self.end_headers()
+        self.wfile.write(b"busy")
+
+
+@contextmanager
+def stub_danbooru(handler=_FixtureHandler):
+    """Serve benchmarks/fixtures on a local port and yield its base URL."""
+    handler.pages = [p.read_bytes() for p in sorted(FIXTURES.glob("danbooru_posts_*.html"))]
+    handler.json_page = (FIXTURES / "danbooru_posts_page.json").read_bytes()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def scaled_corpus(directory, factor, characters=64):
+    """
+    Copy files/ into directory with start/middle/end repeated factor times.
+
+    Only the first characters entries of the character list are kept, so a
+    pre-filled tag cache can cover all of them.
+    """
+    directory = Path(directory)
+    for name in ("start.txt", "middle.txt", "end.txt"):
+        lines = (FILES / name).read_text(encoding="utf-8").splitlines()
+        (directory / name).write_text("\n".join(lines * factor), encoding="utf-8")
+    chars = (FILES / "440028Already29.txt").read_text(encoding="utf-8").split()[:characters]
+    (directory / "440028Already29.txt").write_text("\n".join(chars), encoding="utf-8")
+    shutil.copy(FILES / "clothing.json", directory / "clothing.json")
+    shutil.copy(FILES / "danbooru_scraper.py", directory / "danbooru_scraper.py")
+    return chars
+
+
+def bench_generate_prompts(sizes, repeat):
+    node = CharacterPromptGenerator()
+    lines = (FILES / "middle.txt").read_text(encoding="utf-8").split("\n")
+    lines = [line.strip() for line in lines if line.strip()]
+    for segments in sizes["segments"]:
+        rng = random.Random(segments)
+        scenes = "/".join(rng.choice(lines) for _ in range(segments))
+        inputs = ("lovehent", "pack", "runpod", CHARACTER, "1girl, short_hair, white_hair",
+                  "black_dress, juliet_sleeves", "indoors, bedroom", "masterpiece, best_quality",
+                  scenes, "no", 1)
+        yield "generate_prompts", {"segments": segments}, measure(lambda: node.generate_prompts(*inputs), repeat)
+
+
+def bench_scene_generator(sizes, repeat):
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        for factor in sizes["corpus"]:
+            base = Path(tmp) / f"corpus_x{factor}"
+            base.mkdir()
+            characters = scaled_corpus(base, factor)
+            cache = CharacterTagCache(base / "character_tags.sqlite3")
+            for character in characters:
+                cache.set(character, CHARACTER_TAGS)
+            generator = PromptSceneGenerator(base_path=base, tag_cache=cache)
+            params = {"corpus_lines": len(generator._load_text_lines(generator.files["middle"]))}
+            rng = random.Random(0)
+
+            yield ("select_random_lines_with_context", params,
+                   measure(lambda: generator._select_random_lines_with_context("middle", 8, rng), repeat, 200))
+            novelty = ProjectNovelty(base / "novelty")
+            yield ("select_random_lines_with_context", dict(params, novelty=True),
+                   measure(lambda: generator._select_random_lines_with_context("middle", 8, rng, novelty),
+                           repeat, 200))
+            prompts = (generator._select_random_lines_with_context("start", 4, rng),
+                       generator._select_random_lines_with_context("middle", 8, rng),
+                       generator._select_random_lines_with_context("end", 2, rng))
+            yield ("enhance_prompt_with_clothing", params,
+                   measure(lambda: generator._enhance_prompt_with_clothing(*prompts, "1boy/2boys", rng), repeat, 200))
+            # Keep the per-lookup character prints out of the report
+            with redirect_stdout(devnull):
+                timing = measure(lambda: generator.generate_scene_prompt(4, 8, 2, "1boy", rng), repeat, 20)
+            yield "generate_scene_prompt", params, timing
+            for batch in sizes["batch"]:
+                with redirect_stdout(devnull):
+                    timing = measure(lambda: generator.generate_scene_prompts(batch, 4, 8, 2, "1boy", rng=rng), repeat)
+                yield "generate_scene_prompts", dict(params, batch=batch), timing
+            cache.close()
+
+
+def large_corpus(path, lines):
+    """
+    Write a corpus of lines lines built from middle.txt.
+
+    Every 1000th line is followed by a blank line, alternately empty and made
+    of Unicode whitespace only, which both loaders must skip.
+    """
+    source = [line.strip() for line in (FILES / "middle.txt").read_text(encoding="utf-8").splitlines()
+              if line.strip()]
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for i in range(lines):
+            f.write(source[i % len(source)] + f" {i}\n")
+            if i % 1000 == 0:
+                f.write("\u3000 \n" if i % 2000 else "\n")
+
+
+ASSEMBLY_BASE = "2b_\\(nier:automata\\), 1girl, white_hair, short_hair, hairband, black_hairband, mole_under_mouth"
+ASSEMBLY_INPUTS = ("1girl, solo, looking_at_viewer, blush", "indoors, bedroom",
+                   "masterpiece, best_quality, absurdres, 1girl, solo")
+# CLIP's 77 tokens minus start/end. Tokens are estimated as one per word and
+# per punctuation mark, close to (and never above) the BPE count for Danbooru
+# tags, so chunk counts are a lower bound.
+CHUNK_TOKENS = 75
+_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def concatenated_join(pieces):
+    """The concatenation _enhance_prompt_with_clothing used before join_tags."""
+    return ", ".join(piece for piece in pieces if piece)
+
+
+def concatenated_clean(text):
+    """The separator cleanup generate_prompts applied to hiresfix prompts before the tag assembler."""
+    text = re.sub(r"\s{2,}", " ", text.replace("_", " ")).replace(" ,", ",")
+    return re.sub(r"\|{2,}", "|", re.sub(r",{2,}", ",", text)).strip()
+
+
+def concatenated_prompts(segments):
+    """scene_prompts and hiresfix_prompts as generate_prompts built them before the tag assembler."""
+    details, background, quality = ASSEMBLY_INPUTS
+    org = "by mdf_an,tomu_\\(tomubobu\\),"
+    scene = [f"[2b_nierautomata], {s}, {details}, {quality}" for s in segments]
+    hiresfix = [concatenated_clean(", ".join([org, ASSEMBLY_BASE, s, details, background, quality])) for s in segments]
+    return scene, hiresfix
+
+
+def assembled_prompts(scenes):
+    """scene_prompts and hiresfix_prompts of generate_prompts, for every scene prompt."""
+    node = CharacterPromptGenerator()
+    scene, hiresfix = [], []
+    for scene_prompt in scenes:
+        outputs = node.generate_prompts("lovehent", "pack", "runpod", "2b_nierautomata", ASSEMBLY_BASE,
+                                        *ASSEMBLY_INPUTS, scene_prompt, "no", 1)
+        scene += outputs[1].split("\n")
+        hiresfix += outputs[2]
+    return scene, hiresfix
+
+
+def prompt_stats(prompts):
+    """Average characters, tags, estimated CLIP tokens and 75-token chunks per prompt."""
+    tokens = [len(_TOKEN_RE.findall(p)) for p in prompts]
+    n = len(prompts)
+    return {"chars": round(sum(map(len, prompts)) / n, 1),
+            "tags": round(sum(len([t for t in p.split(",") if t.strip()]) for p in prompts) / n, 1),
+            "tokens": round(sum(tokens) / n, 1),
+            "chunks": round(sum(max(1, math.ceil(t / CHUNK_TOKENS)) for t in tokens) / n, 2)}
+
+
+def seeded_scenes(generator, count):
+    """count scene prompts of a fixed seed, as ScenePromptNode passes them on."""
+    rng = random.Random(0)
+    return [generator._build_scene_prompt(5, 10, 3, "1boy/hetero, 1boy", rng) for _ in range(count)]
+
+
+def bench_tag_assembly(sizes, repeat):
+    generator = PromptSceneGenerator()
+    count = sizes["scenes"]
+    with mock.patch.object(prompt_scene_generator, "join_tags", concatenated_join):
+        segments = [s for scene in seeded_scenes(generator, count) for s in scene.split("/") if s.strip()]
+    scenes = seeded_scenes(generator, count)
+    # The same seeded scenes both ways, with the size of the prompts each produces
+    for assembly, build, inputs in (("concatenation", concatenated_prompts, segments),
+                                    ("tags", assembled_prompts, scenes)):
+        scene, hiresfix = build(inputs)
+        timing = measure(lambda: build(inputs), repeat)
+        yield ("assemble_prompts", {"assembly": assembly, "scenes": count},
+               dict(timing, prompts=len(scene), scene_prompts=prompt_stats(scene),
+                    hiresfix_prompts=prompt_stats(hiresfix)))
+
+
+def bench_line_index(sizes, repeat):
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes["lines"]:
+            path = Path(tmp) / f"middle_{count}.txt"
+            large_corpus(path, count)
+            params = {"lines": count}
+            lines = _read_lines(str(path))
+            mapped = MappedLines(path)
+
+            timing = measure(lambda: _read_lines(str(path)), repeat)
+            yield "read_lines", params, dict(timing, peak_mb=peak_memory(lambda: _read_lines(str(path))))
+
+            def build():
+                index_path(path).unlink()
+                return MappedLines(path)
+            timing = measure(build, repeat)
+            yield ("mapped_lines_build", params,
+                   dict(timing, peak_mb=peak_memory(build), index_mb=round(index_path(path).stat().st_size / 1e6, 1)))
+            timing = measure(lambda: MappedLines(path), repeat)
+            yield "mapped_lines_open", params, dict(timing, peak_mb=peak_memory(lambda: MappedLines(path)))
+
+            for source, sequence in (("tuple", lines), ("mapped", mapped)):
+                sampler = LineSampler(sequence)
+                rng = random.Random(0)
+                yield ("sample_lines", dict(params, source=source),
+                       measure(lambda: sampler.sample(4, rng), repeat, 2000))
+
+
+def to_float(image):
+    """What the node's IMAGE/MASK conversion costs, without needing torch."""
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def decode_each_time(path, target):
+    """What a downstream step given only the logo path does for every image."""
+    with Image.open(path) as source:
+        image = source.convert("RGBA")
+    return to_float(image.resize(fit_size(image.size, target), Image.LANCZOS))
+
+
+def bench_watermark(sizes, repeat):
+    target = COMMON_RESOLUTIONS[0]
+    for path in sorted(FILES.glob("*_watermark.png")):
+        params = {"logo": path.name, "target": "x".join(map(str, target))}
+        cache = WatermarkCache(convert=to_float)
+        yield "watermark_decode_resize", params, measure(lambda: decode_each_time(path, target), repeat)
+        yield "watermark_cold", params, measure(lambda: WatermarkCache(convert=to_float).get(path, target), repeat)
+        yield "watermark_cached", params, measure(lambda: cache.get(path, target), repeat, 1000)
+        cache.warm(path)
+        timing = measure(lambda: WatermarkCache(convert=to_float).warm(path), repeat)
+        yield ("watermark_warm", dict(params, target="common"),
+               dict(timing, resolutions=len(COMMON_RESOLUTIONS), cache_mb=round(cache.nbytes / 1e6, 1)))
+
+
+def fill_tag_counts(store, scraper, characters, posts_per_character=60, seed=0):
+    """
+    Record synthetic characters, as scrapes would, and return their names.
+
+    Their posts mix the posts of the recorded pages with a few tags of each
+    character's own, so no network is needed.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for page in sorted(FIXTURES.glob("danbooru_posts_*.html")):
+        parser = scraper.etree.HTMLParser(target=scraper._DataTagsTarget(lambda tags: pool.append(tags.split())),
+                                          encoding="utf-8")
+        parser.feed(page.read_bytes())
+        parser.close()
+    vocabulary = sorted({tag for tags in pool for tag in tags})
+    names = []
+    for i in range(characters):
+        character = f"character_{i}_(series_{i % 97})"
+        own = rng.sample(vocabulary, 6)
+        counter = Counter()
+        posts = rng.randint(posts_per_character // 2, posts_per_character)
+        for _ in range(posts):
+            tags = [character] + [t for t in rng.choice(pool) if not t.endswith(")")]
+            tags += [t for t in own if rng.random() < 0.7]
+            counter.update(dict.fromkeys(tags, 1))
+        store.record(character, counter, posts)
+        names.append(character)
+    return names
+
+
+def bench_tag_counts(sizes, repeat):
+    scraper = load_scraper(FILES / "danbooru_scraper.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        for characters in sizes["characters"]:
+            store = TagCountStore(Path(tmp) / f"tag_counts_{characters}.sqlite3")
+            names = fill_tag_counts(store, scraper, characters)
+            params = {"characters": characters}
+            stored = {character: store.get(character) for character in names}
+            matrix = store.load()
+
+            # The database with its write-ahead log
+            size = sum(p.stat().st_size for p in Path(tmp).glob(f"tag_counts_{characters}.sqlite3*"))
+            yield ("tag_counts_load", params,
+                   dict(measure(store.load, repeat), pairs=len(matrix.tag_ids), tags=len(matrix.vocabulary) - 1,
+                        store_mb=round(size / 1e6, 1)))
+            yield "process_all", params, measure(lambda: process_all(matrix), repeat)
+            yield "tag_counts_get", params, measure(lambda: [store.get(c) for c in names], repeat)
+            yield ("process_counts", params,
+                   measure(lambda: [scraper.process_counts(counter, posts, character)
+                                    for character, (counter, posts) in stored.items()], repeat))
+            store.close()
+
+
+def bench_scraper(sizes, repeat):
+    scraper = load_scraper(FILES / "danbooru_scraper.py")
+    base_url, rate = scraper.BASE_URL, scraper.limiter.rate
+    with stub_danbooru() as url:
+        # Time the scraper itself, not the rate limiter
+        scraper.BASE_URL, scraper.limiter.rate = url, 0
+        try:
+            yield "scrape_page", {}, measure(lambda: scraper.scrape_page(CHARACTER, 1), repeat, 5)
+            yield "scrape_page_json", {}, measure(lambda: scraper.scrape_page_json(CHARACTER, 1), repeat, 5)
+            for pages in sizes["pages"]:
+                tags_raw = [t for page in range(1, pages + 1) for t in scraper.scrape_page(CHARACTER, page)]
+                yield ("process_tags", {"pages": pages},
+                       measure(lambda: scraper.process_tags(tags_raw, CHARACTER), repeat, 20))
+                yield ("get_character_tags", {"pages": pages},
+                       measure(lambda: scraper.get_character_tags(CHARACTER, pages), repeat))
+        finally:
+            scraper.BASE_URL, scraper.limiter.rate = base_url, rate
+
+
+def peak_rate(times, window=1.0):
+    """Most requests seen in any window-second span, per second."""
+    times = sorted(times)
+    best = start = 0
+    for end in range(len(times)):
+        while times[end] - times[start] > window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best / window
+
+
+def fault_scenario(scraper, characters, pages, p429, p503, timeout=10):
+    """Scrape characters concurrently with injected failures; return the scenario's record."""
+    _FaultyHandler.p429, _FaultyHandler.p503 = p429, p503
+    _FaultyHandler.statuses, _FaultyHandler.times = Counter(), []
+    _FaultyHandler.rng = random.Random(1)  # A seed whose first draws do inject failures
+    # Each scenario starts with a full token bucket and a closed circuit
+    scraper.limiter = scraper.TokenBucket(scraper.limiter.rate, scraper.limiter.burst)
+    scraper.breaker.reset()
+
+    def scrape(character):
+        try:
+            scraper.get_character_tags(character, pages, timeout=timeout)
+            return "ok"
+        except Exception as e:
+            return type(e).__name__
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(characters)) as pool:
+        outcomes = Counter(pool.map(scrape, characters))
+    elapsed = time.perf_counter() - start
+    return {"best": elapsed, "median": elapsed, "repeat": 1, "number": 1, "outcomes": dict(outcomes),
+            "statuses": {str(k): v for k, v in sorted(_FaultyHandler.statuses.items())},
+            "peak_rate": peak_rate(_FaultyHandler.times), "breaker": scraper.breaker.state}
+
+
+def bench_faults(sizes, repeat):
+    scraper = load_scraper(FILES / "danbooru_scraper.py")
+    characters = [f"character_{i}" for i in range(sizes["concurrent"])]
+    pages = sizes["pages"][-1]
+    base_url = scraper.BASE_URL
+    with stub_danbooru(_FaultyHandler) as url, open(os.devnull, "w") as devnull:
+        scraper.BASE_URL = url
+        try:
+            for scenario, p429, p503 in (("healthy", 0.0, 0.0), ("flaky", 0.15, 0.10), ("down", 0.0, 1.0)):
+                params = {"scenario": scenario, "characters": len(characters), "pages": pages}
+                with redirect_stdout(devnull):
+                    record = fault_scenario(scraper, characters, pages, p429, p503)
+                yield "scrape_faults", params, record
+        finally:
+            scraper.BASE_URL = base_url
+            scraper.breaker.reset()
+
+
+def git_commit():
+    """Short hash of HEAD (with a -dirty suffix for local changes), or 'unknown'."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+
+def run(args):
+    sizes = SIZES["quick" if args.quick else "full"]
+    selected = args.only or list(SUITES)
+    commit = git_commit()
+    results = []
+    for suite in selected:
+        for name, params, timing in SUITES[suite](sizes, args.repeat):
+            results.append({"name": name, "params": params, **timing})
+            label = " ".join(f"{k}={v}" for k, v in params.items())
+            extra = {k: v for k, v in timing.items() if k not in ("best", "median", "repeat", "number")}
+            print(f"{name:34s} {label:28s} best {timing['best'] * 1000:9.3f} ms  "
+                  f"median {timing['median'] * 1000:9.3f} ms" + (f"  {extra}" if extra else ""))
+
+    output = Path(args.output) if args.output else RESULTS / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Saved {len(results)} results to {output}")
+
+
+def _key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def compare(args):
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+    head = json.loads(Path(args.head).read_text(encoding="utf-8"))
+    base_results = {_key(r): r for r in base["results"]}
+    print(f"{base['commit']} -> {head['commit']} (median, regression threshold {args.threshold:.0%})")
+    regressions = 0
+    for result in head["results"]:
+        previous = base_results.get(_key(result))
+        if previous is None:
+            continue
+        ratio = result["median"] / previous["median"]
+        flag = ""
+        if ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 - args.threshold:
+            flag = "  faster"
+        label = " ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{result['name']:34s} {label:28s} {previous['median'] * 1000:9.3f} -> "
+              f"{result['median'] * 1000:9.3f} ms  {ratio:5.2f}x{flag}")
+    if regressions:
+        raise SystemExit(f"{regressions} benchmark(s) regressed")
+
+
+SUITES = {"prompts": bench_generate_prompts, "assembly": bench_tag_assembly, "scenes": bench_scene_generator,
+          "lines": bench_line_index, "watermark": bench_watermark, "tag_counts": bench_tag_counts,
+          "scraper": bench_scraper, "faults": bench_faults}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="run the benchmarks and save the results")
+    run_parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast check")
+    run_parser.add_argument("--repeat", type=int, default=7)
+    run_parser.add_argument("--only", nargs="+", choices=list(SUITES))
+    run_parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+
+    compare_parser = sub.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="median slowdown reported as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
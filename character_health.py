@@ -0,0 +1,167 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+
+class HealthRecord(NamedTuple):
+    failures: int            # Consecutive failed scrapes
+    last_reason: Optional[str]
+    last_failure_at: float
+    avg_latency: float       # Moving average of scrape time in seconds
+    scrapes: int
+
+
+class CharacterHealth:
+    """
+    Persistent scrape health of characters, shared between processes.
+
+    Records consecutive failures (timeouts, too few tags, errors), the last
+    failure reason and a moving average of the scrape latency per character.
+    ``weight`` turns a record into a selection weight: characters that keep
+    failing are drawn less and less, then excluded, until their last failure
+    is older than ``failure_ttl``.
+
+    Records are read from an in-memory copy of the table, reloaded every
+    ``refresh`` seconds so other processes' updates are picked up.
+    """
+
+    DEFAULT_FAILURE_TTL = 3 * 24 * 60 * 60  # three days
+    EXCLUDE_AFTER = 3        # Consecutive failures after which a character is not drawn
+    LATENCY_SMOOTHING = 0.3  # Weight of the newest scrape in avg_latency
+
+    def __init__(self, db_path: Union[str, Path], failure_ttl: float = DEFAULT_FAILURE_TTL,
+                 refresh: float = 60.0):
+        """
+        Open (or create) the health database.
+
+        Args:
+            db_path: Path of the SQLite database file
+            failure_ttl: Time in seconds after which failures are forgotten
+            refresh: Time in seconds between reloads of the in-memory records
+        """
+        self.db_path = Path(db_path)
+        self.failure_ttl = failure_ttl
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._records: Dict[str, HealthRecord] = {}
+        self._loaded_at = float("-inf")
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS character_health ("
+            " character TEXT PRIMARY KEY,"
+            " failures INTEGER NOT NULL,"
+            " last_reason TEXT,"
+            " last_failure_at REAL NOT NULL,"
+            " avg_latency REAL NOT NULL,"
+            " scrapes INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _load(self) -> None:
+        now = time.monotonic()
+        if now - self._loaded_at < self.refresh:
+            return
+        rows = self._conn.execute(
+            "SELECT character, failures, last_reason, last_failure_at, avg_latency, scrapes FROM character_health"
+        ).fetchall()
+        self._records = {row[0]: HealthRecord(*row[1:]) for row in rows}
+        self._loaded_at = now
+
+    def get(self, character: str) -> Optional[HealthRecord]:
+        """Return the health record of a character, or None if it was never scraped."""
+        with self._lock:
+            self._load()
+            return self._records.get(character)
+
+    def weight(self, character: str) -> float:
+        """
+        Selection weight of a character between 0 and 1.
+
+        1 for characters without recent failures, halved for each consecutive
+        failure and 0 from EXCLUDE_AFTER failures on, until the last failure
+        is older than failure_ttl.
+        """
+        record = self.get(character)
+        if record is None or not record.failures:
+            return 1.0
+        if self.failure_ttl is not None and time.time() - record.last_failure_at > self.failure_ttl:
+            return 1.0
+        if record.failures >= self.EXCLUDE_AFTER:
+            return 0.0
+        return 0.5 ** record.failures
+
+    def _update(self, character: str, failed: bool, reason: Optional[str], latency: float) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT failures, last_reason, last_failure_at, avg_latency, scrapes"
+                " FROM character_health WHERE character = ?",
+                (character,),
+            ).fetchone()
+            previous = HealthRecord(*row) if row else HealthRecord(0, None, 0.0, latency, 0)
+            avg_latency = previous.avg_latency + self.LATENCY_SMOOTHING * (latency - previous.avg_latency)
+            if failed:
+                record = HealthRecord(previous.failures + 1, reason, time.time(), avg_latency, previous.scrapes + 1)
+            else:
+                record = HealthRecord(0, previous.last_reason, previous.last_failure_at, avg_latency,
+                                      previous.scrapes + 1)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO character_health"
+                " (character, failures, last_reason, last_failure_at, avg_latency, scrapes)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (character, *record),
+            )
+            self._conn.commit()
+            self._records[character] = record
+
+    def record_success(self, character: str, latency: float) -> None:
+        """Record a scrape that returned enough tags; resets the failure count."""
+        self._update(character, False, None, latency)
+
+    def record_failure(self, character: str, reason: str, latency: float) -> None:
+        """Record a failed scrape ('timeout', 'insufficient' or 'error')."""
+        self._update(character, True, reason, latency)
+
+    def forget(self, character: str) -> None:
+        """Remove the record of one character."""
+        with self._lock:
+            self._conn.execute("DELETE FROM character_health WHERE character = ?", (character,))
+            self._conn.commit()
+            self._records.pop(character, None)
+
+    def clear(self) -> None:
+        """Remove every record."""
+        with self._lock:
+            self._conn.execute("DELETE FROM character_health")
+            self._conn.commit()
+            self._records.clear()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+_shared_health: Dict[Tuple[str, Optional[float]], CharacterHealth] = {}
+_shared_lock = threading.Lock()
+
+
+def get_character_health(db_path: Union[str, Path],
+                         failure_ttl: float = CharacterHealth.DEFAULT_FAILURE_TTL) -> CharacterHealth:
+    """
+    Return the process-wide health store for a database path and failure TTL.
+
+    Callers asking for another failure_ttl get their own store on the same
+    database, so no caller changes how long another one remembers failures.
+    """
+    key = (str(Path(db_path).resolve()), failure_ttl)
+    with _shared_lock:
+        health = _shared_health.get(key)
+        if health is None:
+            health = _shared_health[key] = CharacterHealth(db_path, failure_ttl)
+        return health
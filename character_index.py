@@ -0,0 +1,126 @@
+"""
+Resolve free-text character names to the Danbooru tags of the character list.
+
+Users type names like "2B (NieR:Automata)", "2b nier automata" or "2b",
+while the scraper needs the exact tag 2b_(nier:automata). The index maps
+a name to a tag through, in order: the tag itself (case, spaces and
+escapes ignored), its letters and digits alone, the name without the
+series qualifier when only one tag has it, and finally a trigram
+similarity search that must find one clear winner. Names that resolve to
+nothing get ranked suggestions instead of a doomed scrape.
+"""
+import heapq
+import re
+import threading
+from collections import Counter, defaultdict
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from .corpus_cache import FileVersion, corpus_cache, file_version
+
+_SPACES_RE = re.compile(r"\s+")
+_NOT_ALNUM_RE = re.compile(r"[\W_]+")
+# Trailing series qualifier: kama_(fate) -> kama
+_QUALIFIER_RE = re.compile(r"_\([^()]*\)$")
+
+
+def tag_key(name: str) -> str:
+    """Tag spelling of a name: lower case, escapes removed, spaces as '_'."""
+    return _SPACES_RE.sub("_", name.replace("\\", "").strip().lower())
+
+
+def loose_key(name: str) -> str:
+    """Letters and digits of a name, lower case: '2B (NieR:Automata)' -> '2bnierautomata'."""
+    return _NOT_ALNUM_RE.sub("", name.lower())
+
+
+def _trigrams(loose: str) -> set:
+    padded = f"  {loose} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CharacterIndex:
+    """In-memory lookup of character tags by exact, loose and trigram matches."""
+
+    MIN_SCORE = 0.75    # Trigram similarity (Dice) a fuzzy match needs
+    MIN_MARGIN = 0.1    # Lead over the runner-up a fuzzy match needs
+
+    def __init__(self, tags: Sequence[str]):
+        self.tags = list(dict.fromkeys(tags))
+        self._exact: Dict[str, int] = {}
+        self._loose: Dict[str, int] = {}
+        self._base: Dict[str, List[int]] = defaultdict(list)
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        self._sizes: List[int] = []
+        for i, tag in enumerate(self.tags):
+            self._exact.setdefault(tag_key(tag), i)
+            loose = loose_key(tag)
+            self._loose.setdefault(loose, i)
+            base = _QUALIFIER_RE.sub("", tag_key(tag))
+            if base != tag_key(tag):
+                self._base[loose_key(base)].append(i)
+            grams = _trigrams(loose)
+            self._sizes.append(len(grams))
+            for gram in grams:
+                self._postings[gram].append(i)
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def __contains__(self, tag: str) -> bool:
+        return tag_key(tag) in self._exact
+
+    def suggest(self, name: str, k: int = 5) -> List[Tuple[str, float]]:
+        """The k tags most similar to a name, as (tag, score) with scores in [0, 1]."""
+        loose = loose_key(name)
+        if not loose:
+            return []
+        grams = _trigrams(loose)
+        postings = self._postings
+        hits = Counter(chain.from_iterable(postings[gram] for gram in grams if gram in postings))
+        n, sizes = len(grams), self._sizes
+        best = heapq.nsmallest(k, hits.items(), key=lambda hit: (-hit[1] / (n + sizes[hit[0]]), hit[0]))
+        return [(self.tags[i], round(2.0 * common / (n + sizes[i]), 3)) for i, common in best]
+
+    def resolve(self, name: str) -> Optional[str]:
+        """
+        Return the tag a name refers to, or None if no tag matches clearly enough.
+
+        Exact and loose matches win outright; a name without its series
+        qualifier matches if it is unique; otherwise the best trigram match
+        must reach MIN_SCORE and lead the runner-up by MIN_MARGIN.
+        """
+        key = tag_key(name)
+        if not key:
+            return None
+        if key in self._exact:
+            return self.tags[self._exact[key]]
+        loose = loose_key(name)
+        if loose in self._loose:
+            return self.tags[self._loose[loose]]
+        base = self._base.get(loose)
+        if base is not None and len(base) == 1:
+            return self.tags[base[0]]
+        best = self.suggest(name, 2)
+        if best and best[0][1] >= self.MIN_SCORE and (len(best) == 1 or best[0][1] - best[1][1] >= self.MIN_MARGIN):
+            return best[0][0]
+        return None
+
+
+_indexes: Dict[str, Tuple[FileVersion, CharacterIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_character_index(path: Union[str, Path]) -> CharacterIndex:
+    """Return the shared index of a character list, rebuilt when the file changes."""
+    key = str(path)
+    version = file_version(path)
+    entry = _indexes.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if entry is None or entry[0] != version:
+            entry = _indexes[key] = (version, CharacterIndex(corpus_cache.get_lines(path)))
+        return entry[1]
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Sequence, Tuple, Union
+
+from . import tracing
+from .line_index import MappedLines
+
+# (st_mtime_ns, st_size) of a file when it was loaded
+FileVersion = Tuple[int, int]
+
+
+def file_version(path: Union[str, Path]) -> FileVersion:
+    """Return the version stamp (mtime and size) of a file."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class CorpusCache:
+    """
+    Process-wide cache of the data files used to build prompts.
+
+    Each file is parsed once and kept until its mtime or size changes, so
+    steady-state lookups cost a single ``stat`` call and edits to the files
+    are still picked up without restarting ComfyUI.
+
+    Text files of MAP_THRESHOLD bytes or more are not read into memory but
+    served through a memory-mapped line index (see line_index.MappedLines).
+    """
+
+    MAP_THRESHOLD = 16 * 1024 * 1024
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Tuple[FileVersion, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, path: Union[str, Path], kind: str, loader: Callable[[str], Any]) -> Any:
+        key = (str(path), kind)
+        version = file_version(path)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                return entry[1]
+            with tracing.span("corpus.load", path=str(path), kind=kind):
+                value = loader(str(path))
+            self._entries[key] = (version, value)
+            return value
+
+    def get_lines(self, path: Union[str, Path]) -> Sequence[str]:
+        """
+        Return the stripped, non-empty lines of a text file.
+
+        A tuple for ordinary files, a MappedLines sequence for files of
+        MAP_THRESHOLD bytes or more.
+        """
+        return self._get(path, "lines", self._load_lines)
+
+    def _load_lines(self, path: str) -> Sequence[str]:
+        if os.path.getsize(path) >= self.MAP_THRESHOLD:
+            return MappedLines(path)
+        return _read_lines(path)
+
+    def get_json(self, path: Union[str, Path]) -> Any:
+        """Return the parsed content of a JSON file. The result must not be modified."""
+        return self._get(path, "json", _read_json)
+
+    def version(self, paths: Iterable[Union[str, Path]]) -> Tuple[FileVersion, ...]:
+        """Return the current version stamps of several files."""
+        return tuple(file_version(path) for path in paths)
+
+    def clear(self) -> None:
+        """Drop every cached file."""
+        with self._lock:
+            self._entries.clear()
+
+
+def _read_lines(path: str) -> Tuple[str, ...]:
+    # Split on "\n" only, like line_index.build_line_index
+    with open(path, 'r', encoding='utf-8', newline='\n') as f:
+        return tuple(line for line in (raw.strip() for raw in f) if line)
+
+
+def _read_json(path: str) -> Any:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# Shared by every generator in the process
+corpus_cache = CorpusCache()
@@ -1,14 +1,18 @@
 import re
 import os
 
+from .prompt_templates import get_templates
+
 class CharacterPromptGenerator:
+    # Organizations, workspaces and prompt layouts come from files/prompt_templates.json
     @classmethod
     def INPUT_TYPES(s):
+        templates = get_templates()
         return {
             "required": {
-                "organization": (["lovehent", "vixmavis", "violetjoi", "teste"], {}),
-                "project_type": (["comic", "pack", "extra"], {}),
-                "workspace": (["lightning", "runpod", "sagemaker"], {}),
+                "organization": (list(templates.organizations), {}),
+                "project_type": (templates.project_types, {}),
+                "workspace": (list(templates.workspaces), {}),
                 "character_name": ("STRING", {"multiline": True}),
                 "character_base": ("STRING", {"multiline": True}),
                 "character_scene_details": ("STRING", {"multiline": True}),
@@ -32,22 +36,6 @@ class CharacterPromptGenerator:
         sanitized = re.sub(r'[^a-zA-Z0-9_-]', '', text.replace(' ', '_'))
         return sanitized
     
-    def clean_text(self, text):
-        """Clean up text by removing double spaces, double commas, and other formatting issues"""
-        # Replace underline with space
-        text = text.replace('_', ' ')
-        # Remove double spaces
-        text = re.sub(r"\s{2,}", " ", text)
-        # Remove spaces before commas
-        text = text.replace(" ,", ",")
-        # Remove double commas
-        text = re.sub(r",{2,}", ",", text)
-        # Remove double bars
-        text = re.sub(r"\|{2,}", "|", text)
-        # Trim whitespace
-        text = text.strip()
-        return text
-    
     def get_node_directory(self):
         """Get the directory where this node file is located"""
         return os.path.dirname(os.path.abspath(__file__))
@@ -56,57 +44,23 @@ class CharacterPromptGenerator:
                         character_scene_details, background, final_details_quality_tags,
                         prompt_scenes, max_prompts_enabled, max_prompts):
         
-        # Map organization selection to its corresponding value
-        org_mapping = {
-            "lovehent": "by mdf_an, ratatatat74",
-            "vixmavis": "Anime screencap,Koyorin",
-            "violetjoi":"_style0",
-            "teste":"_style0"
-        }
-        
-        # Organization-specific tags for hiresfix_prompts
-        hiresfix_org_mapping = {
-            "teste": "_style0",
-            "vixmavis": "fake_screenshot,Koyorin,by free_style_\(yohan1754\)",
-            "violetjoi":"_style0",
-            "lovehent":"by mdf_an,tomu_\(tomubobu\),"
-        }
-        
-        # Organization-specific source and logo mapping
-        org_info_mapping = {
-            "lovehent": {
-                "source": "https://www.patreon.com/lovehent",
-                "logo": "lovehent_watermark.png"
-            },
-            "vixmavis": {
-                "source": "https://www.patreon.com/vixmavis",
-                "logo": "vixmavis_watermark.png"
-            },
-            "violetjoi": {
-                "source": "https://www.patreon.com/violetjoi",
-                "logo": "violetjoi_watermark.png"
-            },
-            "teste": {
-                "source": "",
-                "logo": ""
-            }
+        templates = get_templates()
+        org_info = templates.organization(organization)
+        values = {
+            "organization": organization,
+            "project_type": project_type,
+            "workspace": workspace,
+            "workspace_path": templates.workspace_path(workspace),
+            "character_name": character_name,
+            "character_base": character_base,
+            "character_scene_details": character_scene_details,
+            "background": background,
+            "final_details_quality_tags": final_details_quality_tags,
+            **org_info,
         }
         
-        org_value = org_mapping.get(organization, "")
-        hiresfix_org_value = hiresfix_org_mapping.get(organization, "")
-        org_info = org_info_mapping.get(organization, {"source": "", "logo": ""})
-        
-        # Map workspace selection to its corresponding file path
-        workspace_paths = {
-            "lightning": "/teamspace/studios/this_studio/Packreator/",
-            "runpod": "/workspace/Packreator/",
-            "sagemaker": "/workspace/sage/Packreator/"
-        }
-        
-        workspace_path = workspace_paths[workspace]
-        
-        # Generate title
-        title = f"{character_name} {project_type}"
+        # Generate title and savepaths
+        templates.render_text(values)
         
         # Generate source and logo paths
         source = org_info["source"]
@@ -117,17 +71,8 @@ class CharacterPromptGenerator:
         else:
             logo = ""
         
-        # Generate base savepath
-        base_savepath = f"{workspace_path}{organization}/{project_type}/{character_name}"
-        
-        # Generate the three savepaths
-        savepath_high_quality = f"{base_savepath}/high_quality"
-        savepath_low_quality = f"{base_savepath}/lowquality"
-        savepath_watermarked = f"{base_savepath}/watermarked"
-        
         # Generate character prompt
-        character_prompt = f"[{character_name}], {org_value}, {character_base}, {background}"
-        #character_prompt = self.clean_text(character_prompt)
+        character_prompt = templates.tags["character_prompt"].render(values)
         
         # Process prompt scenes
         prompt_segments = prompt_scenes.split("/")
@@ -136,29 +81,18 @@ class CharacterPromptGenerator:
         if max_prompts_enabled == "yes":
             prompt_segments = prompt_segments[:max_prompts]
         
-        # Generate scene prompts and hiresfix prompts
-        scene_prompts_list = []
-        hiresfix_prompts_list = []
+        # Skip empty segments
+        segments = [segment.strip() for segment in prompt_segments]
+        segments = [segment for segment in segments if segment]
         
-        for segment in prompt_segments:
-            segment = segment.strip()
-            if segment:  # Skip empty segments
-                # Construct full prompt for scene_prompts
-                full_prompt = f"[{character_name}], {segment}, {character_scene_details}, {final_details_quality_tags}"
-                #full_prompt = self.clean_text(full_prompt)
-                scene_prompts_list.append(full_prompt)
-                
-                # Construct hiresfix prompt with different format and organization-specific tags
-                if hiresfix_org_value:
-                    hiresfix_prompt = f"{hiresfix_org_value}, {character_base}, {segment}, {character_scene_details}, {background}, {final_details_quality_tags}"
-                else:
-                    hiresfix_prompt = f"{character_base}, {segment}, {character_scene_details}, {background}, {final_details_quality_tags}"
-                
-                hiresfix_prompt = self.clean_text(hiresfix_prompt)
-                hiresfix_prompts_list.append(hiresfix_prompt)
+        # Construct full prompts for scene_prompts and cleaned hiresfix prompts; the
+        # template pieces shared by every segment are only filled and parsed once
+        scene_prompts_list = templates.tags["scene_prompt"].render_segments(values, segments)
+        hiresfix_prompts_list = templates.tags["hiresfix_prompt"].render_segments(values, segments)
         
         # Join scene prompts into a multi-line string
         scene_prompts = "\n".join(scene_prompts_list)
         
-        return (character_prompt, scene_prompts, hiresfix_prompts_list,base_savepath, savepath_high_quality, 
-                savepath_low_quality, savepath_watermarked, source, logo, title)
+        return (character_prompt, scene_prompts, hiresfix_prompts_list, values["base_savepath"],
+                values["savepath_high_quality"], values["savepath_low_quality"], values["savepath_watermarked"],
+                source, logo, values["title"])
@@ -3,18 +3,28 @@ danbooru_scraper.py
 Busca as tags mais frequentes de um personagem no Danbooru.
 
 Uso:
-    python danbooru_scraper.py <character_tag>
+    python danbooru_scraper.py <character_tag> [num_pages]
+
+Também pode ser importado e usado no mesmo processo:
+    get_character_tags("2b_(nier:automata)", pages=3, timeout=10)
 """
 
+import contextvars
+import email.utils
 import math
+import os
+import random
 import re
 import sys
+import threading
 import time
 from collections import Counter
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 
 import requests
 from bs4 import BeautifulSoup
+from lxml import etree
 
 # --- Configurações ---------------------------------------------------------
 
@@ -22,49 +32,539 @@ UA = "Mozilla/5.0 (compatible; TagScraper/1.0; +https://github.com/)"
 MAX_WORKERS = 8          # limite de threads
 TIMEOUT = 10             # segundos
 RETRIES = 3              # tentativas de download por página
+RATE = float(os.environ.get("DANBOORU_RATE", "4"))   # requisições/s no processo inteiro
+BURST = 8                # requisições que podem sair de uma vez
+BACKOFF_BASE = 0.5       # segundos; dobra a cada tentativa (com jitter)
+BACKOFF_MAX = 8          # teto do backoff e do Retry-After aceito
+BREAKER_THRESHOLD = 5    # falhas seguidas que abrem o circuito
+BREAKER_COOLDOWN = 30    # segundos com o circuito aberto antes de testar de novo
+CHUNK_SIZE = 16 * 1024   # bytes lidos por vez no parser em streaming
+POSTS_PER_PAGE = 20      # posts por página da listagem HTML
+JSON_LIMIT = 200         # posts por requisição na API JSON (máximo do Danbooru)
+CONFIDENCE = 0.15        # margem (fração dos posts) que encerra a busca adaptativa
+
+# pode apontar para um servidor local que serve respostas gravadas
+BASE_URL = os.environ.get("DANBOORU_BASE_URL", "https://danbooru.donmai.us").rstrip("/")
 
-# --- Sessão HTTP com retries ----------------------------------------------
+# --- Sessão HTTP ------------------------------------------------------------
 
+# um só pool de conexões para todas as raspagens; as retentativas ficam só
+# em _get, que respeita o limitador, o Retry-After e o circuito
 session = requests.Session()
 session.headers["User-Agent"] = UA
 adapter = requests.adapters.HTTPAdapter(
-    pool_maxsize=MAX_WORKERS, max_retries=RETRIES
+    pool_maxsize=MAX_WORKERS, max_retries=0
 )
 session.mount("https://", adapter)
+session.mount("http://", adapter)
 
-# --- Etapa 1 – baixar páginas ---------------------------------------------
+# pool de threads compartilhado entre chamadas (processo "quente")
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="danbooru")
+
+def _submit(fn, *args):
+    """Envia fn ao pool numa cópia do contexto atual.
+
+    Assim as etapas abertas nas threads do pool (ver ``span``) ficam
+    penduradas na etapa de quem pediu a página.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+# --- Medição opcional -----------------------------------------------------
+
+class _NullSpan:
+    """Etapa que não mede nada (padrão quando o scraper roda sozinho)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+def span(name: str, **attrs):
+    """Gancho de medição por etapa.
+
+    Quem importa o scraper pode trocá-lo por uma função compatível (o
+    ``scraper_client`` usa ``tracing.span`` do pacote).
+    """
+    return _NULL_SPAN
+
+class ScrapeTimeout(TimeoutError):
+    """O prazo total da raspagem estourou.
+
+    ``upstream`` diz se o Danbooru teve culpa: o prazo acabou enquanto a
+    raspagem esperava a resposta ou o corpo de uma página, e nenhuma
+    requisição dela precisou esperar o limitador de taxa. Qualquer espera
+    na fila local deixa o campo falso (ver ``_tracked``).
+    """
+    upstream = False
+
+class ScrapeCancelled(Exception):
+    """A raspagem foi cancelada por quem a pediu."""
+
+class ScrapeUnavailable(Exception):
+    """O circuito está aberto: o Danbooru vem falhando e a raspagem nem é tentada."""
+
+class ScrapeError(Exception):
+    """O Danbooru respondeu algo fora do formato esperado."""
+
+def _remaining(deadline: float | None, cancel=None) -> float:
+    """Segundos restantes até o prazo (TIMEOUT se não houver prazo).
+
+    ``cancel`` é um objeto com ``is_set()`` (ex.: ``threading.Event``).
+    """
+    if cancel is not None and cancel.is_set():
+        raise ScrapeCancelled("raspagem cancelada")
+    if deadline is None:
+        return TIMEOUT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise ScrapeTimeout("prazo da raspagem esgotado")
+    return remaining
+
+class _Requests:
+    """Onde o prazo de uma raspagem foi gasto: esperando o Danbooru ou o limitador."""
+
+    def __init__(self):
+        self.stalled = False        # o prazo acabou durante uma espera pelo Danbooru
+        self.throttled = False      # alguma requisição esperou o limitador
+        self._waiting = 0           # esperas pelo Danbooru em curso agora
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def sending(self, deadline: float | None):
+        """Marca uma espera pelo Danbooru (envio ou um pedaço do corpo), sem o parse."""
+        with self._lock:
+            self._waiting += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.stalled = True
+
+    @property
+    def upstream(self) -> bool:
+        with self._lock:
+            return (self.stalled or self._waiting > 0) and not self.throttled
+
+# as threads do pool recebem uma cópia do contexto (ver _submit), então
+# todas as páginas de uma raspagem enxergam o mesmo _Requests
+_requests: contextvars.ContextVar = contextvars.ContextVar("danbooru_requests", default=None)
+_UNTRACKED = _Requests()    # requisições fora de _tracked (ex.: fetch direto)
+
+def _tracker() -> _Requests:
+    return _requests.get() or _UNTRACKED
+
+@contextmanager
+def _tracked():
+    """Acompanha as requisições de uma raspagem e preenche ``upstream`` do ScrapeTimeout que escapar."""
+    tracker = _Requests()
+    token = _requests.set(tracker)
+    try:
+        yield
+    except ScrapeTimeout as e:
+        e.upstream = tracker.upstream
+        raise
+    finally:
+        _requests.reset(token)
+
+# --- Controle de tráfego ----------------------------------------------------
+
+class TokenBucket:
+    """Limitador de taxa compartilhado por todas as threads do processo.
+
+    Libera até ``burst`` requisições de uma vez e depois ``rate`` por
+    segundo. ``pause`` segura todo mundo (ex.: depois de um 429 com
+    Retry-After).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def available(self) -> float:
+        """Tokens que dá para pegar agora sem esperar (0 durante uma pausa)."""
+        if self.rate <= 0:
+            return math.inf
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return 0.0
+            return min(self.burst, self._tokens + (now - self._updated) * self.rate)
+
+    def acquire(self, deadline: float | None = None, cancel=None) -> bool:
+        """Espera um token; levanta ``ScrapeTimeout`` se a espera passar do prazo.
+
+        Devolve se precisou esperar.
+        """
+        if self.rate <= 0:
+            return False
+        waited = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            if wait > _remaining(deadline, cancel):
+                raise ScrapeTimeout("prazo esgotado esperando o limitador de taxa")
+            time.sleep(wait)
+            waited = True
+
+class CircuitBreaker:
+    """Abre depois de ``threshold`` falhas seguidas e corta as requisições por ``cooldown`` s.
+
+    Passado o cooldown deixa passar uma requisição de teste: sucesso fecha
+    o circuito, falha o abre de novo.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+                return "half-open"
+            return "open"
+
+    def allow(self, probe: bool = True) -> bool:
+        """Levanta ``ScrapeUnavailable`` se o circuito estiver aberto.
+
+        Devolve True se a chamada ficou com a vaga da requisição de teste
+        (circuito meio aberto); quem a recebe precisa chamar ``success``,
+        ``failure`` ou ``release``. Com ``probe=False`` só verifica, sem
+        reservar a vaga.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if not self._probing and time.monotonic() - self._opened_at >= self.cooldown:
+                self._probing = probe   # só uma requisição de teste por vez
+                return probe
+        raise ScrapeUnavailable("Danbooru indisponível (circuito aberto)")
+
+    def release(self) -> None:
+        """Devolve a vaga de teste de uma requisição que terminou sem resultado (ex.: cancelada)."""
+        with self._lock:
+            self._probing = False
+
+    def success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def reset(self) -> None:
+        self.success()
+
+# compartilhados por todas as raspagens do processo
+limiter = TokenBucket(RATE, BURST)
+breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+def _retry_after(response) -> float | None:
+    """Segundos pedidos pelo cabeçalho Retry-After (número ou data HTTP)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+def _get(url: str, deadline: float | None = None, cancel=None, **kwargs):
+    """GET com limitador de taxa, circuito e backoff; devolve a resposta ou None.
 
-def fetch(url: str) -> str:
-    """Faz download de uma URL com pequenas retentativas."""
-    for _ in range(RETRIES):
+    429 e 5xx (e erros de conexão) são repetidos até ``RETRIES`` vezes,
+    esperando o Retry-After (limitado a ``BACKOFF_MAX``) ou um backoff
+    exponencial com jitter; um 429 pausa o limitador para todas as threads.
+    Outros 4xx não são repetidos. Se a espera não couber no prazo, levanta
+    ``ScrapeTimeout`` na hora em vez de gastar o prazo inteiro. Com o
+    circuito aberto levanta ``ScrapeUnavailable`` sem fazer a requisição.
+    Com ``stream=True`` quem chama precisa fechar a resposta.
+    """
+    tracker = _tracker()
+    for attempt in range(1, RETRIES + 1):
+        # com o circuito aberto falha já, sem gastar token; a vaga de teste só
+        # é reservada depois do token e do prazo, logo antes da requisição
+        breaker.allow(probe=False)
         try:
-            r = session.get(url, timeout=TIMEOUT)
-            r.raise_for_status()
-            return r.text
-        except requests.exceptions.RequestException:
-            time.sleep(1)
-    return ""
-
-def scrape_page(tag: str, page: int) -> list[str]:
+            if limiter.acquire(deadline, cancel):
+                tracker.throttled = True
+        except ScrapeTimeout:
+            tracker.throttled = True    # o prazo nem coube na fila do limitador
+            raise
+        timeout = min(TIMEOUT, _remaining(deadline, cancel))
+        probe = breaker.allow()
+        retry_after = None
+        with span("scraper.fetch", url=url, attempt=attempt, probe=probe) as s:
+            try:
+                with tracker.sending(deadline):
+                    r = session.get(url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                breaker.failure()
+                s.set(error=type(e).__name__)
+            else:
+                s.set(status=r.status_code)
+                if r.status_code < 400:
+                    breaker.success()
+                    return r
+                r.close()
+                if r.status_code != 429 and r.status_code < 500:
+                    breaker.success()       # o servidor respondeu; o erro é da requisição
+                    return None
+                breaker.failure()
+                retry_after = _retry_after(r)
+                if r.status_code == 429:
+                    limiter.pause(min(BACKOFF_MAX, retry_after or BACKOFF_BASE))
+            finally:
+                if probe:
+                    breaker.release()   # sem efeito se success/failure já rodou
+        if attempt == RETRIES:
+            break
+        if retry_after is not None:
+            wait = min(BACKOFF_MAX, retry_after)
+        else:
+            wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        if wait > _remaining(deadline, cancel):
+            raise ScrapeTimeout("prazo esgotado esperando para repetir a requisição")
+        with span("scraper.retry_wait", url=url, attempt=attempt, seconds=round(wait, 3)):
+            time.sleep(wait)
+    return None
+
+# --- Etapa 1 – baixar páginas ---------------------------------------------
+
+def fetch(url: str, deadline: float | None = None, cancel=None) -> str:
+    """Faz download de uma URL (ver ``_get``), respeitando o prazo; "" se falhar."""
+    r = _get(url, deadline, cancel)
+    return "" if r is None else r.text
+
+def scrape_page(tag: str, page: int, deadline: float | None = None, cancel=None) -> list[str]:
     """Extrai o conteúdo de data‑tags de uma página."""
-    html = fetch(f"https://danbooru.donmai.us/posts?page={page}&tags={tag}")
-    if not html:
-        return []
-    soup = BeautifulSoup(html, "lxml")      # lxml é bem mais rápido
-    return [art["data-tags"] for art in soup.select(
-        "div.posts-container.gap-2 > article"
-    )]
-
-def scrape_booru(tag: str, num_pages: int = 3) -> list[str]:
-    """Busca várias páginas em paralelo e devolve a lista de strings de tags."""
-    workers = min(MAX_WORKERS, num_pages)
+    with span("scraper.page", tag=tag, page=page, parser="soup") as s:
+        html = fetch(f"{BASE_URL}/posts?page={page}&tags={tag}", deadline, cancel)
+        if not html:
+            s.set(posts=0)
+            return []
+        with span("scraper.parse", parser="soup"):
+            soup = BeautifulSoup(html, "lxml")      # lxml é bem mais rápido
+            tags = [art["data-tags"] for art in soup.select(
+                "div.posts-container.gap-2 > article"
+            )]
+        s.set(posts=len(tags))
+        return tags
+
+# --- Etapa 1b – parser em streaming ---------------------------------------
+
+class TagCounts:
+    """Contagem de tags e de posts, atualizada post a post."""
+
+    def __init__(self):
+        self.counter: Counter = Counter()
+        self.posts = 0
+
+    def add(self, data_tags: str) -> None:
+        """Conta as tags (separadas por espaço) de um post."""
+        self.counter.update(data_tags.split())
+        self.posts += 1
+
+    def merge(self, other: "TagCounts") -> None:
+        """Soma outra contagem a esta, preservando a ordem de primeira ocorrência."""
+        self.counter.update(other.counter)
+        self.posts += other.posts
+
+class _DataTagsTarget:
+    """Alvo do parser lxml: repassa o data-tags de ``div.posts-container.gap-2 > article``.
+
+    Não monta DOM; só mantém uma pilha dizendo se cada elemento aberto é
+    o contêiner de posts.
+    """
+
+    def __init__(self, on_tags):
+        self.on_tags = on_tags
+        self.stack: list[bool] = []
+
+    def start(self, tag, attrib):
+        if tag == "article" and self.stack and self.stack[-1]:
+            data_tags = attrib.get("data-tags")
+            if data_tags is not None:
+                self.on_tags(data_tags)
+        self.stack.append(
+            tag == "div" and {"posts-container", "gap-2"} <= set(attrib.get("class", "").split())
+        )
+
+    def end(self, tag):
+        if self.stack:
+            self.stack.pop()
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        return None
+
+def count_data_tags(chunks, encoding: str = "utf-8", deadline: float | None = None,
+                    cancel=None) -> TagCounts:
+    """Conta as tags dos posts de uma página HTML entregue em pedaços de bytes."""
+    counts = TagCounts()
+    parser = etree.HTMLParser(target=_DataTagsTarget(counts.add), encoding=encoding)
+    for chunk in chunks:
+        _remaining(deadline, cancel)
+        parser.feed(chunk)
+    parser.close()
+    return counts
+
+def _received(chunks, deadline: float | None):
+    """Repassa os pedaços do corpo; só a espera por cada um conta como espera pelo Danbooru."""
+    tracker = _tracker()
+    chunks = iter(chunks)
+    while True:
+        with tracker.sending(deadline):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+def scrape_page_counts(tag: str, page: int, deadline: float | None = None,
+                       cancel=None) -> TagCounts:
+    """Conta as tags de uma página enquanto os bytes chegam, sem montar DOM."""
+    url = f"{BASE_URL}/posts?page={page}&tags={tag}"
+    # download e parse se intercalam: a etapa mede os dois juntos
+    with span("scraper.page", tag=tag, page=page, parser="stream") as s:
+        r = _get(url, deadline, cancel, stream=True)
+        if r is None:
+            s.set(posts=0)
+            return TagCounts()
+        with r:
+            try:
+                counts = count_data_tags(
+                    _received(r.iter_content(CHUNK_SIZE), deadline), r.encoding or "utf-8", deadline, cancel
+                )
+            except requests.exceptions.RequestException:
+                breaker.failure()       # a conexão caiu no meio da página
+                s.set(posts=0, error="stream")
+                return TagCounts()
+        s.set(posts=counts.posts)
+        return counts
+
+# --- Etapa 1c – API JSON ----------------------------------------------------
+
+def scrape_page_json(tag: str, page: int, limit: int = JSON_LIMIT,
+                     deadline: float | None = None, cancel=None) -> list[str]:
+    """Lê uma página de ``posts.json`` pedindo só o campo ``tag_string``.
+
+    Devolve o mesmo formato de ``scrape_page``: uma string de tags por post.
+    Levanta ``ScrapeError`` se o corpo não for uma lista de posts (ex.: o
+    objeto de erro ``{"success": false, ...}`` da API).
+    """
+    url = f"{BASE_URL}/posts.json"
+    params = {"tags": tag, "page": page, "limit": limit, "only": "tag_string"}
+    with span("scraper.page", tag=tag, page=page, parser="json") as s:
+        r = _get(url, deadline, cancel, params=params)
+        if r is None:
+            s.set(posts=0)
+            return []
+        try:
+            posts = r.json()
+        except ValueError:
+            posts = None
+        if not isinstance(posts, list) or not all(isinstance(post, dict) for post in posts):
+            s.set(error="format")
+            raise ScrapeError(f"resposta inesperada de posts.json: {r.text[:200]!r}")
+        tags = [post["tag_string"] for post in posts if post.get("tag_string")]
+        s.set(posts=len(tags))
+        return tags
+
+def scrape_booru_json(tag: str, num_posts: int, limit: int = JSON_LIMIT,
+                      deadline: float | None = None, cancel=None) -> list[str]:
+    """Busca os primeiros ``num_posts`` posts pela API JSON, ``limit`` por requisição."""
+    limit = max(1, min(limit, num_posts))
+    num_requests = math.ceil(num_posts / limit)
+    futures = [_submit(scrape_page_json, tag, p, limit, deadline, cancel)
+               for p in range(1, num_requests + 1)]
+    tags: list[str] = []
+    for page_tags in _gather(futures, tag, deadline):
+        tags.extend(page_tags)
+    return tags[:num_posts]
+
+def _gather(futures: list, tag: str, deadline: float | None) -> list:
+    """Espera as páginas até o prazo e devolve os resultados na ordem das páginas."""
+    timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+    done, pending = wait(futures, timeout=timeout, return_when=FIRST_EXCEPTION)
+    if pending:
+        for f in pending:
+            f.cancel()
+        if not any(f.exception() for f in done):
+            raise ScrapeTimeout(f"prazo esgotado raspando {tag}")
+    return [f.result() for f in futures if f in done]   # propaga ScrapeTimeout/erros
+
+def scrape_booru(tag: str, num_pages: int = 3, deadline: float | None = None,
+                 cancel=None) -> list[str]:
+    """Busca várias páginas em paralelo e devolve a lista de strings de tags.
+
+    Com ``deadline`` (valor de ``time.monotonic()``), levanta ``ScrapeTimeout``
+    quando o prazo estoura e cancela as páginas que ainda não começaram.
+    Com ``cancel`` sinalizado, as páginas em andamento param na próxima
+    verificação e levantam ``ScrapeCancelled``.
+    """
+    futures = [_submit(scrape_page, tag, p, deadline, cancel) for p in range(1, num_pages + 1)]
     tags: list[str] = []
-    with ThreadPoolExecutor(max_workers=workers) as exe:
-        futures = {exe.submit(scrape_page, tag, p): p for p in range(1, num_pages + 1)}
-        for f in as_completed(futures):
-            tags.extend(f.result())
+    for page_tags in _gather(futures, tag, deadline):
+        tags.extend(page_tags)
     return tags
 
+def scrape_booru_counts(tag: str, num_pages: int = 3, deadline: float | None = None,
+                        cancel=None) -> TagCounts:
+    """Como ``scrape_booru``, mas com o parser em streaming e já devolvendo as contagens.
+
+    Cada página é contada enquanto chega; as contagens são somadas na ordem
+    das páginas, então o resultado é idêntico ao caminho antigo.
+    """
+    futures = [_submit(scrape_page_counts, tag, p, deadline, cancel)
+               for p in range(1, num_pages + 1)]
+    counts = TagCounts()
+    for page_counts in _gather(futures, tag, deadline):
+        counts.merge(page_counts)
+    return counts
+
 # --- Etapa 2 – filtrar e escolher tags ------------------------------------
 
 KEYWORDS = {
@@ -75,16 +575,32 @@ KEYWORDS = {
 }
 EXCLUDED_RE = re.compile(r"^(?!1)\d+(girl|boy)s?$")   # permite 1girl/1boy
 
-def process_tags(tags_raw: list[str], character_tag: str) -> str:
-    """Transforma tags brutas em uma string final, mantendo as mais relevantes."""
+def process_tags(tags_raw: list[str], character_tag: str, on_counts=None) -> str:
+    """Transforma tags brutas em uma string final, mantendo as mais relevantes.
+
+    ``on_counts``, se dado, recebe ``(contagens, número de posts)`` antes da
+    seleção (ex.: para guardar as contagens e refazer a seleção sem raspar).
+    """
     if not tags_raw:
         return character_tag
 
     # achata lista e conta frequência
     all_tags = [t for raw in tags_raw for t in raw.split()]
-    counter = Counter(all_tags)
+    return process_counts(Counter(all_tags), len(tags_raw), character_tag, on_counts)
+
+def process_counts(counter: Counter, num_posts: int, character_tag: str, on_counts=None) -> str:
+    """Como ``process_tags``, mas a partir das contagens já prontas."""
+    if on_counts is not None and num_posts:
+        on_counts(counter, num_posts)
+    with span("scraper.select_tags", posts=num_posts, distinct=len(counter)):
+        return ", ".join(select_tags(counter, num_posts, character_tag))
 
-    half = math.ceil(len(tags_raw) / 2)
+def select_tags(counter: Counter, num_posts: int, character_tag: str) -> list[str]:
+    """Escolhe, em ordem, as tags finais a partir das contagens."""
+    if not num_posts:
+        return [character_tag]
+
+    half = math.ceil(num_posts / 2)
     frequent = {t: c for t, c in counter.items() if c >= half}
 
     # gênero se aparecer em ≥ metade das imagens
@@ -112,19 +628,135 @@ def process_tags(tags_raw: list[str], character_tag: str) -> str:
         final.append(gender_tag)
     final.extend(related)
     final.extend(additional)
-    return ", ".join(dict.fromkeys(final))   # dict mantém primeira ocorrência
+    return list(dict.fromkeys(final))   # dict mantém primeira ocorrência
+
+# --- Etapa 3 – parada antecipada -------------------------------------------
+
+def selection_margin(counter: Counter, num_posts: int, character_tag: str) -> float:
+    """Quão longe a escolha de ``select_tags`` está de mudar, em fração dos posts.
+
+    É a menor distância entre uma decisão e o seu limite: tags de gênero e
+    com palavra‑chave contra o limiar de metade das imagens, a última tag
+    relacionada escolhida contra a primeira deixada de fora, e o mesmo para
+    as duas genéricas. Com margem 0,15, mudar qualquer escolha exige que
+    mais 15% dos posts contrariem a contagem atual.
+    """
+    if not num_posts:
+        return 0.0
+    half = math.ceil(num_posts / 2)
+    margins = [1.0]
+    related = []
+    for t, c in counter.items():
+        if t in ("1girl", "1boy") or any(k in t for k in KEYWORDS):
+            margins.append(abs(c - num_posts / 2) / num_posts)
+            if c >= half and t not in ("1girl", "1boy"):
+                related.append((c, t))
+    related.sort(key=lambda item: item[0], reverse=True)
+    if len(related) > 8:
+        margins.append((related[7][0] - related[8][0]) / num_posts)
+    chosen = {t for _, t in related[:8]}
+    others = [c for t, c in counter.most_common()
+              if t not in chosen and t != character_tag and not EXCLUDED_RE.match(t)]
+    if len(others) > 2:
+        margins.append((others[1] - others[2]) / num_posts)
+    return min(margins)
+
+def scrape_booru_adaptive(tag: str, max_pages: int = 6, wave: int = 1, patience: int = 1,
+                          deadline: float | None = None, cancel=None,
+                          confidence: float = CONFIDENCE) -> tuple[TagCounts, int]:
+    """Busca páginas em ondas até a seleção de tags ficar segura.
+
+    Depois de cada onda de ``wave`` páginas para quando a margem da seleção
+    (``selection_margin``) chega a ``confidence`` — uma página basta quando
+    ela já decide tudo com folga —, quando a seleção (com a ordem) fica
+    igual por ``patience`` ondas seguidas, quando uma onda não traz posts
+    novos (fim dos resultados) ou ao atingir ``max_pages``.
+
+    Returns:
+        (contagens, número de páginas baixadas)
+    """
+    counts = TagCounts()
+    selection: list[str] | None = None
+    stable = 0
+    fetched = 0
+    while fetched < max_pages:
+        pages = range(fetched + 1, min(max_pages, fetched + wave) + 1)
+        futures = [_submit(scrape_page_counts, tag, p, deadline, cancel) for p in pages]
+        posts_before = counts.posts
+        for page_counts in _gather(futures, tag, deadline):
+            counts.merge(page_counts)
+        fetched += len(pages)
+        if counts.posts == posts_before:
+            break
+
+        if selection_margin(counts.counter, counts.posts, tag) >= confidence:
+            break
+        current = select_tags(counts.counter, counts.posts, tag)
+        stable = stable + 1 if current == selection else 0
+        selection = current
+        if stable >= patience:
+            break
+    return counts, fetched
 
 # --- Interface de alto nível ----------------------------------------------
 
-def get_character_tags(character_tag: str, pages: int = 3) -> str:
-    raw = scrape_booru(character_tag, pages)
-    return process_tags(raw, character_tag)
+def get_character_tags(character_tag: str, pages: int = 3, timeout: float | None = None,
+                       cancel=None, parser: str = "stream", backend: str = "html",
+                       json_limit: int = JSON_LIMIT, on_counts=None) -> str:
+    """Raspa e processa as tags de um personagem dentro do processo atual.
+
+    ``timeout`` é o prazo total em segundos; ao estourar levanta ``ScrapeTimeout``
+    (com ``upstream`` dizendo se o prazo acabou esperando só o Danbooru).
+    ``cancel`` (ex.: ``threading.Event``) interrompe a raspagem quando sinalizado.
+    ``backend`` escolhe entre a listagem HTML ("html") e a API JSON ("json");
+    no JSON são lidos os mesmos ``pages * POSTS_PER_PAGE`` posts, em
+    requisições de até ``json_limit`` posts.
+    ``parser`` (só no HTML) escolhe entre o parser em streaming ("stream") e
+    o caminho antigo com BeautifulSoup ("soup"), mantido para comparação.
+    ``on_counts`` recebe as contagens brutas (ver ``process_tags``).
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with span("scraper.character", character=character_tag, pages=pages, backend=backend, parser=parser), \
+            _tracked():
+        if backend == "json":
+            raw = scrape_booru_json(character_tag, pages * POSTS_PER_PAGE, json_limit, deadline, cancel)
+            return process_tags(raw, character_tag, on_counts)
+        if backend != "html":
+            raise ValueError(f"backend desconhecido: {backend}")
+        if parser == "soup":
+            raw = scrape_booru(character_tag, pages, deadline, cancel)
+            return process_tags(raw, character_tag, on_counts)
+        if parser != "stream":
+            raise ValueError(f"parser desconhecido: {parser}")
+        counts = scrape_booru_counts(character_tag, pages, deadline, cancel)
+        return process_counts(counts.counter, counts.posts, character_tag, on_counts)
+
+def get_character_tags_adaptive(character_tag: str, max_pages: int = 6, wave: int = 1,
+                                patience: int = 1, timeout: float | None = None,
+                                cancel=None, on_counts=None,
+                                confidence: float = CONFIDENCE) -> tuple[str, int]:
+    """Como ``get_character_tags``, mas com parada antecipada (ver ``scrape_booru_adaptive``).
+
+    Só existe para a listagem HTML com o parser em streaming: a API JSON já
+    traz até ``JSON_LIMIT`` posts por requisição.
+
+    Returns:
+        (tags, número de páginas baixadas)
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with span("scraper.character", character=character_tag, pages=max_pages, backend="html",
+              parser="adaptive") as s, _tracked():
+        counts, pages_used = scrape_booru_adaptive(character_tag, max_pages, wave, patience, deadline, cancel,
+                                                   confidence)
+        s.set(pages_used=pages_used)
+        return process_counts(counts.counter, counts.posts, character_tag, on_counts), pages_used
 
 # --- Execução direta -------------------------------------------------------
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Uso: python danbooru_scraper.py <character_tag>")
+    if len(sys.argv) not in (2, 3):
+        print("Uso: python danbooru_scraper.py <character_tag> [num_pages]")
         sys.exit(1)
 
-    print(get_character_tags(sys.argv[1]))
+    pages = int(sys.argv[2]) if len(sys.argv) == 3 else 3
+    print(get_character_tags(sys.argv[1], pages))
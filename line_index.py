@@ -0,0 +1,142 @@
+"""
+Memory-mapped access to the lines of very large corpus files.
+
+The offsets of the non-empty lines are indexed once into a sidecar file
+(middle.txt -> middle.txt.idx, an array of uint64) that is memory-mapped
+together with the text, so opening a corpus costs the same whatever its
+size and only the lines actually read are decoded. The index is rebuilt
+when the text file's mtime or size no longer match the ones it was built
+from.
+"""
+import heapq
+import mmap
+import os
+import re
+import struct
+from array import array
+from pathlib import Path
+from typing import Iterator, List, Sequence, Union, overload
+
+_MAGIC = b"PKLI"
+_HEADER = struct.Struct("<4sIqqQ")    # magic, version, source mtime_ns, source size, line count
+_VERSION = 2
+# Lines are split on b"\n" only and kept if str.strip() leaves something, as
+# corpus_cache._read_lines does. A line with a byte that is not whitespace in
+# any decoding is kept outright; one made only of whitespace and non-ASCII
+# bytes may decode to Unicode whitespace (e.g. U+3000), so it is decoded and
+# stripped. The "\n" prefix lets the regex engine skip ahead to line starts.
+_LINE_RE = re.compile(rb"[^\n]*?[^\s\x1c-\x1f\x80-\xff][^\n]*")
+_MAYBE_BLANK = rb"[\t\x0b\x0c\r \x1c-\x1f\x80-\xff]+(?![^\n])"
+_FIRST_MAYBE_BLANK_RE = re.compile(_MAYBE_BLANK)
+_MAYBE_BLANK_RE = re.compile(rb"\n(" + _MAYBE_BLANK + rb")")
+
+
+def index_path(path: Union[str, Path]) -> Path:
+    """Sidecar index file of a corpus file."""
+    path = Path(path)
+    return path.with_name(path.name + ".idx")
+
+
+def _map(path: Union[str, Path]) -> mmap.mmap:
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _unicode_lines(text) -> Iterator[int]:
+    """Start offsets of the lines without a surely non-whitespace byte that str.strip() keeps."""
+    first = _FIRST_MAYBE_BLANK_RE.match(text)
+    if first and first.group().decode("utf-8").strip():
+        yield 0
+    for match in _MAYBE_BLANK_RE.finditer(text):
+        if match.group(1).decode("utf-8").strip():
+            yield match.start(1)
+
+
+def build_line_index(path: Union[str, Path], destination: Union[str, Path, None] = None) -> array:
+    """
+    Index the start offsets of the non-empty lines of a text file.
+
+    Args:
+        path: UTF-8 text file
+        destination: Index file to write (replaced atomically); not written if None
+
+    Returns:
+        The offsets, as an array of uint64
+    """
+    st = os.stat(path)
+    offsets = array("Q")
+    if st.st_size:
+        with _map(path) as text:
+            offsets.extend(heapq.merge((match.start() for match in _LINE_RE.finditer(text)),
+                                       _unicode_lines(text)))
+    if destination is not None:
+        destination = Path(destination)
+        tmp = destination.with_name(destination.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, st.st_mtime_ns, st.st_size, len(offsets)))
+            offsets.tofile(f)
+        os.replace(tmp, destination)
+    return offsets
+
+
+class MappedLines(Sequence[str]):
+    """
+    Read-only sequence of the stripped, non-empty lines of a text file.
+
+    Behaves like the tuple returned for small files, but keeps only the
+    memory-mapped text and offsets; lines are decoded when accessed.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        st = os.stat(self.path)
+        self._text = _map(self.path) if st.st_size else b""
+        self._index_map = None
+        self._offsets = self._open_index(st)
+
+    def _open_index(self, st: os.stat_result):
+        sidecar = index_path(self.path)
+        try:
+            index_map = _map(sidecar)
+            magic, version, mtime_ns, size, count = _HEADER.unpack_from(index_map)
+            if (magic, version, mtime_ns, size) == (_MAGIC, _VERSION, st.st_mtime_ns, st.st_size) \
+                    and len(index_map) == _HEADER.size + count * 8:
+                self._index_map = index_map
+                return memoryview(index_map)[_HEADER.size:].cast("Q")
+            index_map.close()
+        except (OSError, ValueError, struct.error):
+            pass
+        try:
+            return build_line_index(self.path, sidecar)
+        except OSError:
+            # Read-only directory: keep the index in memory only
+            return build_line_index(self.path)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _line(self, i: int) -> str:
+        start = self._offsets[i]
+        end = self._text.find(b"\n", start)
+        if end < 0:
+            end = len(self._text)
+        return self._text[start:end].decode("utf-8").strip()
+
+    @overload
+    def __getitem__(self, i: int) -> str: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[str]: ...
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._line(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("line index out of range")
+        return self._line(i)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self._line(i)
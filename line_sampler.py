@@ -0,0 +1,206 @@
+import bisect
+import itertools
+import math
+import os
+import random
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from .corpus_cache import FileVersion, corpus_cache, file_version
+from .novelty import Bitset
+
+
+def weights_path(path: Union[str, Path]) -> str:
+    """Sidecar weights file of a corpus file: middle.txt -> middle.weights.json."""
+    return os.path.splitext(str(path))[0] + ".weights.json"
+
+
+class LineSampler:
+    """
+    Samples scene lines as (line, next line) pairs.
+
+    Pair i covers lines i and i + 1 (a one-line corpus is a single pair of one
+    line). A sample draws pairs without replacement and never lets two pairs
+    share a line, so no line is returned twice.
+    """
+
+    # Weighted draws rejected (already used or overlapping) before switching
+    # to a linear pass over the remaining pairs
+    MAX_REJECTIONS = 32
+
+    def __init__(self, lines: Sequence[str], weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            lines: Corpus lines, in file order
+            weights: Optional weight per line text; a pair is drawn with the weight
+                of its first line. Lines not listed weigh 1, lines with weight 0
+                only appear as the second line of a pair.
+        """
+        self.lines = lines
+        self.pairs = max(1, len(lines) - 1) if lines else 0
+        self._cumulative: Optional[List[float]] = None
+        self._weights: Optional[List[float]] = None
+        if weights:
+            self._weights = [max(0.0, float(weights.get(line, 1.0))) for line in lines[:self.pairs]]
+            self._cumulative = list(itertools.accumulate(self._weights))
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def _pair(self, start: int) -> Sequence[str]:
+        return self.lines[start:start + 2]
+
+    def sample(self, count: int, rng: random.Random, used: Optional[Bitset] = None) -> List[str]:
+        """
+        Draw pairs until count lines are collected (fewer if the corpus runs out).
+
+        Args:
+            count: Number of lines to return
+            rng: Source of randomness
+            used: Lines returned by earlier samples (size = len(self)). When
+                given, only pairs whose lines are both unused are drawn, their
+                lines are added, and the set is cleared once no such pair is left.
+
+        Returns:
+            The lines of the drawn pairs, pair by pair in draw order
+        """
+        if count <= 0 or not self.lines:
+            return []
+        # At most ceil(pairs / 2) pairs fit without overlapping
+        k = min(math.ceil(count / 2), math.ceil(self.pairs / 2))
+        if used is not None:
+            starts = self._novel_starts(k, count, rng, used)
+        elif self._cumulative is None:
+            starts = self._uniform_starts(k, rng)
+        else:
+            starts = self._weighted_starts(k, rng)
+        result = []
+        for start in starts:
+            result.extend(self._pair(start))
+        return result[:count]
+
+    def _uniform_starts(self, k: int, rng: random.Random) -> List[int]:
+        """
+        k non-overlapping pair starts, uniformly among all such choices.
+
+        Choosing k distinct values from range(pairs - k + 1) and adding its rank
+        to each one spaces them at least 2 apart; the draw order is kept.
+        """
+        drawn = rng.sample(range(self.pairs - k + 1), k)
+        ranks = sorted(range(k), key=drawn.__getitem__)
+        for rank, i in enumerate(ranks):
+            drawn[i] += rank
+        return drawn
+
+    def _weighted_starts(self, k: int, rng: random.Random) -> List[int]:
+        """k non-overlapping pair starts drawn by weight, without replacement."""
+        cumulative = self._cumulative
+        total = cumulative[-1]
+        starts: List[int] = []
+        taken = set()
+        rejections = 0
+        while len(starts) < k and total > 0 and rejections < self.MAX_REJECTIONS:
+            start = bisect.bisect_right(cumulative, rng.random() * total)
+            if start >= len(cumulative) or start in taken or start - 1 in taken or start + 1 in taken:
+                rejections += 1
+                continue
+            starts.append(start)
+            taken.add(start)
+        if len(starts) < k:
+            starts.extend(self._weighted_fill(k - len(starts), taken, rng))
+        return starts
+
+    def _novel_starts(self, k: int, count: int, rng: random.Random, used: Bitset) -> List[int]:
+        """
+        k pair starts whose lines are not in used.
+
+        The lines of each pair are added as it is drawn, except a second line
+        cut off by count, which stays free for later samples.
+        """
+        starts: List[int] = []
+        while len(starts) < k:
+            start = self._novel_start(rng, used, starts)
+            if start is None:
+                break
+            returned = min(2, len(self.lines) - start, count - 2 * len(starts))
+            starts.append(start)
+            for line in range(start, start + returned):
+                used.add(line)
+        return starts
+
+    def _novel_start(self, rng: random.Random, used: Bitset, taken: List[int]) -> Optional[int]:
+        def free(start: int) -> bool:
+            return (start < self.pairs and start not in used
+                    and (start + 1 >= len(self.lines) or start + 1 not in used)
+                    and (self._weights is None or self._weights[start] > 0))
+
+        for _ in range(2):
+            if used.full:
+                used.clear()
+            # Cheap random draws first; they only miss often once most lines are used
+            for _ in range(self.MAX_REJECTIONS):
+                if self._cumulative is None:
+                    start = rng.randrange(self.pairs)
+                else:
+                    start = bisect.bisect_right(self._cumulative, rng.random() * self._cumulative[-1])
+                if free(start):
+                    return start
+            # Then walk the unused lines from a random point
+            start = used.next_clear(rng.randrange(len(self.lines)))
+            for _ in range(used.size - len(used)):
+                if free(start):
+                    return start
+                start = used.next_clear(start + 1)
+            # Only lone or zero-weight lines are left: start the pool over,
+            # keeping the lines already returned by this sample
+            used.clear()
+            for start in taken:
+                for line in range(start, min(start + 2, len(self.lines))):
+                    used.add(line)
+        return None
+
+    def _weighted_fill(self, k: int, taken: set, rng: random.Random) -> List[int]:
+        """Finish a crowded weighted draw with weighted random keys over the free pairs."""
+        keyed = []
+        for start, weight in enumerate(self._weights):
+            if weight > 0 and not (start in taken or start - 1 in taken or start + 1 in taken):
+                keyed.append((rng.random() ** (1.0 / weight), start))
+        keyed.sort(reverse=True)
+        starts = []
+        for _, start in keyed:
+            if len(starts) == k:
+                break
+            if start in taken or start - 1 in taken or start + 1 in taken:
+                continue
+            starts.append(start)
+            taken.add(start)
+        return starts
+
+
+_samplers: Dict[str, Tuple[Tuple[FileVersion, Optional[FileVersion]], LineSampler]] = {}
+_samplers_lock = threading.Lock()
+
+
+def get_line_sampler(path: Union[str, Path]) -> LineSampler:
+    """
+    Return the shared sampler of a corpus file.
+
+    Rebuilt when the file or its weights sidecar (see weights_path) changes.
+    """
+    key = str(path)
+    sidecar = weights_path(path)
+    try:
+        sidecar_version = file_version(sidecar)
+    except FileNotFoundError:
+        sidecar_version = None
+    version = (file_version(path), sidecar_version)
+    entry = _samplers.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _samplers_lock:
+        entry = _samplers.get(key)
+        if entry is None or entry[0] != version:
+            weights = corpus_cache.get_json(sidecar) if sidecar_version is not None else None
+            entry = _samplers[key] = (version, LineSampler(corpus_cache.get_lines(path), weights))
+        return entry[1]
@@ -0,0 +1,173 @@
+"""
+Cross-run novelty tracking.
+
+A project remembers which scene lines and characters it has already used,
+one bit per entry and corpus, so sampling can prefer unused entries until
+a corpus is exhausted and then start over. The bitsets are saved under
+files/novelty/<project>/ and reset when a corpus changes size.
+"""
+import os
+import re
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+_MAGIC = b"PKNV"
+_HEADER = struct.Struct("<4sQ")    # magic, number of entries
+_NOT_FULL = re.compile(rb"[^\xff]")
+
+
+class Bitset:
+    """Fixed-size set of small integers, stored as one bit each."""
+
+    __slots__ = ("size", "bits", "count")
+
+    def __init__(self, size: int, bits: Optional[bytes] = None):
+        self.size = size
+        self.bits = bytearray((size + 7) // 8) if bits is None else bytearray(bits)
+        self._pad()
+        self.count = int.from_bytes(self.bits, "little").bit_count() - self._padding()
+
+    def _padding(self) -> int:
+        return len(self.bits) * 8 - self.size
+
+    def _pad(self) -> None:
+        # The unused bits of the last byte stay set, so they never look free
+        if self._padding():
+            self.bits[-1] |= (0xFF << (8 - self._padding())) & 0xFF
+
+    def __contains__(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.size
+
+    def add(self, i: int) -> None:
+        mask = 1 << (i & 7)
+        if not self.bits[i >> 3] & mask:
+            self.bits[i >> 3] |= mask
+            self.count += 1
+
+    def clear(self) -> None:
+        self.bits = bytearray(len(self.bits))
+        self._pad()
+        self.count = 0
+
+    def next_clear(self, start: int) -> Optional[int]:
+        """First entry not in the set at or after start, wrapping around; None if full."""
+        if self.full or not self.size:
+            return None
+        start %= self.size
+        byte = start >> 3
+        for i in range(start, min(self.size, (byte + 1) * 8)):
+            if i not in self:
+                return i
+        match = _NOT_FULL.search(self.bits, byte + 1) or _NOT_FULL.search(self.bits, 0, byte + 1)
+        value = self.bits[match.start()]
+        i = match.start() * 8
+        while value & 1:
+            value >>= 1
+            i += 1
+        return i
+
+
+def draw_unused(used: Bitset, rng, tries: int = 8) -> int:
+    """
+    Draw a random entry not in used and add it, clearing used first when full.
+
+    A few random probes find a free entry while the set is sparse; after that
+    the next free entry from a random point is taken.
+    """
+    if used.full:
+        used.clear()
+    for _ in range(tries):
+        i = rng.randrange(used.size)
+        if i not in used:
+            break
+    else:
+        i = used.next_clear(rng.randrange(used.size))
+    used.add(i)
+    return i
+
+
+class ProjectNovelty:
+    """
+    Used-entry bitsets of one project, one per corpus.
+
+    Not thread-safe: hold ``lock`` while drawing and saving.
+    """
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.lock = threading.Lock()
+        self._pools: Dict[str, Bitset] = {}
+
+    def _path(self, corpus: str) -> Path:
+        return self.directory / f"{corpus}.bits"
+
+    def pool(self, corpus: str, size: int) -> Bitset:
+        """
+        Return the used entries of a corpus with size entries.
+
+        Loaded from disk on first use; starts empty when the saved bitset is
+        missing or was recorded for a corpus of another size.
+        """
+        pool = self._pools.get(corpus)
+        if pool is not None and pool.size == size:
+            return pool
+        pool = None
+        try:
+            data = self._path(corpus).read_bytes()
+            magic, saved_size = _HEADER.unpack_from(data)
+            if magic == _MAGIC and saved_size == size:
+                pool = Bitset(size, data[_HEADER.size:])
+        except (OSError, struct.error):
+            pass
+        if pool is None or len(pool.bits) != (size + 7) // 8:
+            pool = Bitset(size)
+        self._pools[corpus] = pool
+        return pool
+
+    def save(self) -> None:
+        """Write every loaded bitset, replacing each file atomically."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for corpus, pool in self._pools.items():
+            path = self._path(corpus)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, pool.size))
+                f.write(pool.bits)
+            os.replace(tmp, path)
+
+    def reset(self) -> None:
+        """Forget every used entry of the project."""
+        for pool in self._pools.values():
+            pool.clear()
+        if self.directory.exists():
+            for path in self.directory.glob("*.bits"):
+                path.unlink()
+
+
+_projects: Dict[str, ProjectNovelty] = {}
+_projects_lock = threading.Lock()
+
+
+def project_name(project: str) -> str:
+    """Directory-safe form of a project name."""
+    return re.sub(r"[^\w.-]", "_", project.strip()) or "default"
+
+
+def get_project_novelty(root: Union[str, Path], project: str) -> ProjectNovelty:
+    """Return the shared novelty state of a project stored under root."""
+    directory = Path(root) / project_name(project)
+    key = str(directory)
+    with _projects_lock:
+        novelty = _projects.get(key)
+        if novelty is None:
+            novelty = _projects[key] = ProjectNovelty(directory)
+        return novelty
@@ -1,25 +1,78 @@
-import os
-import json
 import random
-import subprocess
 import time
-import sys
-from typing import List, Dict, Any, Tuple, Optional
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Sequence, Tuple, Optional
 from pathlib import Path
 
+from .character_health import CharacterHealth, get_character_health
+from .character_index import get_character_index
+from .corpus_cache import FileVersion, corpus_cache
+from .line_sampler import get_line_sampler
+from .novelty import ProjectNovelty, draw_unused, get_project_novelty
+from .prompt_text import join_tags
+from .scraper_client import (CancelToken, ScraperBusy, ScraperUnavailable, available_requests, scrape_in_process,
+                             scrape_subprocess)
+from .tag_cache import CharacterTagCache, get_tag_cache
+from .tag_counts import TagCountStore, get_tag_count_store
+from .tag_profiles import get_profile_index
+from .tracing import propagate, span
+
 class PromptSceneGenerator:
     """
     Generates scene prompts by combining texts from different files and appending
     additional information from a JSON configuration and character tags.
+    
+    Generation keeps no per-call state on the instance: every random choice is
+    drawn from the rng passed to generate_scene_prompt(s), so one generator can
+    serve several threads and each seeded call is reproducible on its own.
     """
     
-    def __init__(self, base_path: str = None):
+    # Draws per candidate before settling for a character with a poor health record
+    MAX_HEALTH_REDRAWS = 8
+    # Character tags returned when no candidate could be looked up
+    FALLBACK_TAGS = "character"
+    
+    def __init__(self, base_path: str = None, tag_cache: Optional[CharacterTagCache] = None,
+                 cache_ttl: float = CharacterTagCache.DEFAULT_TTL, scrape_pages: int = 3,
+                 scraper_mode: str = "inprocess", hedge_width: int = 1, adaptive_pages: bool = False,
+                 adaptive_max_pages: int = 6,
+                 scraper_backend: str = "html", health: Optional[CharacterHealth] = None,
+                 failure_ttl: float = CharacterHealth.DEFAULT_FAILURE_TTL,
+                 tag_counts: Optional[TagCountStore] = None):
         """
         Initialize the PromptSceneGenerator with path configuration.
         
         Args:
             base_path: Base path where all input files are located. Defaults to './files' relative to this script.
+            tag_cache: Cache for scraped character tags. Defaults to a shared SQLite cache in base_path.
+            cache_ttl: Time in seconds a cached character entry stays valid (used for the default cache)
+            scrape_pages: Number of Danbooru pages scraped per character
+            scraper_mode: 'inprocess' to import the scraper once and run it in this process,
+                'subprocess' to run the scraper script in a new interpreter per attempt
+            hedge_width: Number of candidate characters scraped concurrently. With 1 the
+                candidates are tried one after another, each with its own timeout; with
+                more, they share one overall deadline and the first candidate (in order)
+                with enough tags wins. Extra candidates only start while the in-process
+                scraper's rate limiter can serve them right away
+            adaptive_pages: Fetch a character's pages one at a time and stop as soon as its
+                selected tags are settled (in-process scraper and html backend only)
+            adaptive_max_pages: Page cap of adaptive scraping; may exceed scrape_pages for
+                characters that need more posts
+            scraper_backend: 'html' to parse the posts listing pages, 'json' to read the same
+                posts from the posts JSON API (in-process scraper only, not adaptive)
+            health: Scrape health of characters, used to skip characters that keep failing.
+                Defaults to a shared SQLite store in base_path.
+            failure_ttl: Time in seconds after which a character's failures are forgotten
+                (used for the default health store)
+            tag_counts: Store of the raw tag counts of in-process scrapes, so tag selection
+                can be re-run without scraping (see tag_counts.py). Defaults to a shared
+                SQLite store in base_path.
         """
+        if scraper_mode not in ("inprocess", "subprocess"):
+            raise ValueError(f"Unknown scraper mode: {scraper_mode}")
+        if adaptive_pages and scraper_backend != "html":
+            raise ValueError(f"Adaptive scraping needs the html backend, not {scraper_backend!r}")
         if base_path is None:
             base_path = Path(__file__).parent / "files"
         self.base_path = Path(base_path)
@@ -37,149 +90,327 @@ class PromptSceneGenerator:
             if not path.exists():
                 raise FileNotFoundError(f"Required file not found: {path}")
         
-        # Load configuration
-        self.clothing_config = self._load_json(self.files["clothing"])
+        # Character tag cache shared by every generator (and process) using the same file
+        if tag_cache is None:
+            tag_cache = get_tag_cache(self.base_path / "character_tags.sqlite3", cache_ttl)
+        self.tag_cache = tag_cache
+        if health is None:
+            health = get_character_health(self.base_path / "character_health.sqlite3", failure_ttl)
+        self.health = health
+        if tag_counts is None:
+            tag_counts = get_tag_count_store(self.base_path / "tag_counts.sqlite3")
+        self.tag_counts = tag_counts
+        # Optional precomputed profiles (see tag_profiles.py), looked up before the cache
+        self.profile_index_path = self.base_path / "tag_profiles.idx"
+        # Per-project used lines and characters (see novelty.py)
+        self.novelty_path = self.base_path / "novelty"
+        self.scrape_pages = scrape_pages
+        self.scraper_mode = scraper_mode
+        self.hedge_width = max(1, hedge_width)
+        self.adaptive_pages = adaptive_pages
+        self.adaptive_max_pages = max(1, adaptive_max_pages)
+        self.scraper_backend = scraper_backend
+    
+    @property
+    def clothing_config(self) -> Dict:
+        """Clothing configuration, reloaded when clothing.json changes."""
+        return self._load_json(self.files["clothing"])
     
     def _load_json(self, file_path: Path) -> Dict:
-        """Load and parse a JSON file."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        """Load and parse a JSON file (cached until the file changes)."""
+        return corpus_cache.get_json(file_path)
+    
+    def _load_text_lines(self, file_path: Path) -> Sequence[str]:
+        """Load lines from a text file (cached until the file changes)."""
+        return corpus_cache.get_lines(file_path)
     
-    def _load_text_lines(self, file_path: Path) -> List[str]:
-        """Load lines from a text file."""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return [line.strip() for line in f.readlines() if line.strip()]
+    def get_novelty(self, project: Optional[str]) -> Optional[ProjectNovelty]:
+        """Return the novelty state of a project, or None if no project is given."""
+        if not project or not project.strip():
+            return None
+        return get_project_novelty(self.novelty_path, project)
     
-    def _get_context_lines(self, lines: List[str], index: int, context_size: int) -> List[str]:
+    def resolve_character(self, name: str) -> Optional[str]:
         """
-        Get the selected line and the line below it.
+        Return the character tag a free-text name refers to (see character_index.py).
         
         Args:
-            lines: List of all text lines
-            index: Center index for context
-            context_size: Total number of lines to return (ignored in this implementation)
+            name: Character name as typed, e.g. "2B (NieR:Automata)" or "kama fate"
             
         Returns:
-            List containing the selected line and the line below (if available)
+            The matching tag of the character list, or None if no tag matches clearly
         """
-        if not lines:
-            return []
-        
-        # Always get the selected line
-        result = [lines[index]]
-        
-        # Add the line below if it exists
-        if index + 1 < len(lines):
-            result.append(lines[index + 1])
+        return get_character_index(self.files["characters"]).resolve(name)
+    
+    def suggest_characters(self, name: str, k: int = 5) -> List[Tuple[str, float]]:
+        """The k character tags most similar to a name, as (tag, similarity)."""
+        return get_character_index(self.files["characters"]).suggest(name, k)
+    
+    def corpus_version(self) -> Tuple[FileVersion, ...]:
+        """
+        Version stamp of the data files scenes are built from.
         
-        return result
+        Changes whenever start.txt, middle.txt, end.txt, clothing.json or the
+        character list is edited, so it can key caches of generated scenes.
+        """
+        return corpus_cache.version(self.files[name] for name in ("start", "middle", "end", "clothing", "characters"))
     
-    def _select_random_lines_with_context(self, file_type: str, count: int) -> List[str]:
+    def _select_random_lines_with_context(self, file_type: str, count: int, rng: random.Random,
+                                          novelty: Optional[ProjectNovelty] = None) -> List[str]:
         """
         Select random lines with context from the specified file.
         
+        Each pick is a line and the line below it. Picks never repeat or
+        overlap, and are weighted by the optional sidecar file
+        (e.g. middle.weights.json, mapping line text to weight).
+        
         Args:
             file_type: The type of file to read from ('start', 'middle', or 'end')
             count: How many lines to select (including context)
+            rng: Source of randomness
+            novelty: Project whose unused picks are preferred (None to ignore history)
             
         Returns:
-            List of selected lines
+            List of selected lines (fewer than count if the file runs out)
         """
         if count <= 0:
             return []
-            
-        lines = self._load_text_lines(self.files[file_type])
-        if not lines:
-            return []
+        sampler = get_line_sampler(self.files[file_type])
+        used = novelty.pool(file_type, len(sampler)) if novelty is not None else None
+        return sampler.sample(count, rng, used)
+    
+    def _run_scraper(self, character: str, timeout: float, cancel: Optional[CancelToken] = None) -> str:
+        """
+        Scrape the tags of a character with the configured scraper mode.
         
-        # If we need less or equal lines than available, just return random ones
-        if count >= len(lines):
-            return lines
+        Falls back to the subprocess scraper when the scraper cannot be
+        imported into this process (e.g. missing dependencies).
         
-        result = []
-        remaining = count
+        Raises:
+            TimeoutError: If the scrape did not finish within timeout seconds
+        """
+        if self.scraper_mode == "inprocess":
+            try:
+                pages = self.adaptive_max_pages if self.adaptive_pages else self.scrape_pages
+                return scrape_in_process(self.files["scraper"], character, pages, timeout, cancel,
+                                         self.adaptive_pages, self.scraper_backend,
+                                         lambda counts, posts: self.tag_counts.record(character, counts, posts))
+            except ImportError as e:
+                print(f"In-process scraper unavailable ({e}), falling back to subprocess")
+                self.scraper_mode = "subprocess"
+        return scrape_subprocess(self.files["scraper"], character, self.scrape_pages, timeout, cancel)
+    
+    def _cache_key(self) -> Tuple[int, str]:
+        """Pages and source the tag cache files the configured scraper's results under."""
+        if self.scraper_mode != "inprocess":
+            return self.scrape_pages, "html"
+        if self.adaptive_pages:
+            return self.adaptive_max_pages, "adaptive"
+        return self.scrape_pages, self.scraper_backend
+    
+    def _pick_character_candidates(self, rng: random.Random, max_attempts: int = 3,
+                                   novelty: Optional[ProjectNovelty] = None) -> List[str]:
+        """
+        Draw the random characters tried, in order, by one character tag lookup.
         
-        while remaining > 0:
-            # How many lines to select in this iteration
-            # This helps handle cases where count is small
-            batch_size = min(remaining, max(1, remaining // 2))
-            
-            # Select a random line and get context around it
-            random_index = random.randint(0, len(lines) - 1)
-            context_lines = self._get_context_lines(lines, random_index, batch_size)
+        Args:
+            rng: Source of randomness
+            max_attempts: Number of characters to draw
+            novelty: Project whose unused characters are drawn; every candidate
+                counts as used, since each one may cost a scrape
             
-            # Add to result and update remaining
-            result.extend(context_lines)
-            remaining -= len(context_lines)
+        Returns:
+            List of character tags (empty if the character list is empty)
+        """
+        characters = self._load_text_lines(self.files["characters"])
+        if not characters:
+            return []
+        used = novelty.pool("characters", len(characters)) if novelty is not None else None
+        
+        def draw(source: random.Random) -> str:
+            if used is None:
+                return source.choice(characters)
+            return characters[draw_unused(used, source)]
         
-        # Trim if we somehow got too many lines
-        return result[:count]
+        # Characters that keep failing are kept with probability health.weight
+        # (0 excludes them). Those checks and redraws use their own rng, seeded
+        # once per scene, so the health records never shift later draws from rng
+        health_rng = random.Random(rng.getrandbits(64))
+        candidates = []
+        for _ in range(max_attempts):
+            character = draw(rng)
+            for _ in range(self.MAX_HEALTH_REDRAWS - 1):
+                weight = self.health.weight(character)
+                if weight >= 1.0 or health_rng.random() < weight:
+                    break
+                character = draw(health_rng)
+            candidates.append(character)
+        return candidates
     
-    def _get_character_tags(self, timeout: int = 10) -> str:
+    def _try_character(self, character: str, deadline: float,
+                       cancel: Optional[CancelToken] = None) -> Optional[str]:
         """
-        Get character tags by running the danbooru scraper script.
+        Get the tags of one candidate character from the cache or the scraper.
         
         Args:
-            timeout: Maximum time in seconds to wait for the script
+            character: Character tag to look up
+            deadline: time.monotonic() value by which the scrape must finish
+            cancel: Token that aborts the scrape when cancelled
             
         Returns:
-            Character tags as a string
+            The tags, or None if the scrape failed or returned too few tags
         """
-        characters = self._load_text_lines(self.files["characters"])
-        if not characters:
-            return ""
+        print(character)
         
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            # Select random character
-            self.selected_character = random.choice(characters)
-            print(self.selected_character)
+        # The span records where the tags came from and how the attempt ended
+        with span("character.attempt", character=character) as s:
+            profile_index = get_profile_index(self.profile_index_path)
+            if profile_index is not None:
+                profile_tags = profile_index.get(character)
+                if profile_tags is not None:
+                    s.set(source="profile", outcome="ok")
+                    return profile_tags
+            
+            pages, source = self._cache_key()
+            cached_tags = self.tag_cache.get(character, pages, source=source)
+            if cached_tags is not None:
+                s.set(source="cache", outcome="ok")
+                return cached_tags
             
+            s.set(source="scrape", mode=self.scraper_mode)
+            started = time.monotonic()
             try:
-                # Run scraper script
-                start_time = time.time()
-                process = subprocess.Popen(
-                    [sys.executable, str(self.files["scraper"]), self.selected_character],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                # Wait for completion or timeout
-                while time.time() - start_time < timeout:
-                    if process.poll() is not None:
-                        break
-                    time.sleep(0.1)
-                
-                # Check if process is still running (timeout occurred)
-                if process.poll() is None:
-                    process.terminate()
-                    print(f"Scraper timed out for character: {self.selected_character}")
-                    continue  # Try another character
-                
-                # Check output
-                stdout, _ = process.communicate()
-                tags = stdout.strip()
-                
-                # Validate the number of tags
-                tag_count = len([t for t in tags.split(',') if t.strip()])
-                if tag_count <= 3:
-                    print(f"Insufficient tags ({tag_count}) for character: {self.selected_character}")
-                    continue  # Try another character
-                
-                return tags
-                
+                tags = self._run_scraper(character, deadline - time.monotonic(), cancel)
+            except ScraperBusy as e:
+                # Only the local rate limiter or worker queue ran out of time: no health record
+                print(f"Scraper busy for character {character}: {e}")
+                s.set(outcome="busy")
+                return self._stale_tags(character, s)
+            except TimeoutError:
+                print(f"Scraper timed out for character: {character}")
+                s.set(outcome="timeout")
+                self.health.record_failure(character, "timeout", time.monotonic() - started)
+                return self._stale_tags(character, s)  # None tries another character
+            except ScraperUnavailable as e:
+                # Danbooru is failing, not this character: no health record
+                print(f"Scraper unavailable for character {character}: {e}")
+                s.set(outcome="unavailable")
+                return self._stale_tags(character, s)
             except Exception as e:
-                print(f"Error running scraper for character {self.selected_character}: {e}")
+                if cancel is not None and cancel.is_set():
+                    s.set(outcome="cancelled")
+                    return None
+                print(f"Error running scraper for character {character}: {e}")
+                s.set(outcome="error")
+                self.health.record_failure(character, "error", time.monotonic() - started)
+                return self._stale_tags(character, s)
+            latency = time.monotonic() - started
+            
+            # Validate the number of tags
+            tag_count = len([t for t in tags.split(',') if t.strip()])
+            if tag_count <= 3:
+                print(f"Insufficient tags ({tag_count}) for character: {character}")
+                s.set(outcome="insufficient", tag_count=tag_count)
+                self.health.record_failure(character, "insufficient", latency)
+                return None  # Try another character
+            
+            # The scraper may have fallen back to a subprocess: file under what actually ran
+            self.tag_cache.set(character, tags, *self._cache_key())
+            self.health.record_success(character, latency)
+            s.set(outcome="ok", tag_count=tag_count)
+            return tags
+    
+    def _stale_tags(self, character: str, trace_span) -> Optional[str]:
+        """Return the expired cached tags of a character, if any, after a failed scrape."""
+        pages, source = self._cache_key()
+        stale_tags = self.tag_cache.get(character, pages, allow_expired=True, source=source)
+        if stale_tags is not None:
+            print(f"Using expired cached tags for character: {character}")
+            trace_span.set(source="stale_cache")
+        return stale_tags
+    
+    def _fetch_character_tags(self, candidates: List[str], timeout: int = 10) -> Tuple[str, str]:
+        """
+        Get the tags of the first candidate character with enough tags.
+        
+        Safe to call from several threads at once.
+        
+        Args:
+            candidates: Characters to try, in order
+            timeout: Maximum time in seconds to wait for each scrape, or for the
+                whole lookup in hedged mode (hedge_width > 1)
+            
+        Returns:
+            Tuple of (character, tags)
+        """
+        if not candidates:
+            return "", ""
+        
+        with span("character.lookup", candidates=len(candidates), hedge_width=self.hedge_width) as s:
+            if self.hedge_width > 1:
+                character, tags = self._fetch_character_tags_hedged(candidates, timeout)
+            else:
+                character, tags = self._fetch_character_tags_sequential(candidates, timeout)
+            s.set(character=character)
+        return character, tags
+    
+    def _fetch_character_tags_sequential(self, candidates: List[str], timeout: float) -> Tuple[str, str]:
+        """Try the candidates one after another, each with its own timeout."""
+        for character in candidates:
+            tags = self._try_character(character, time.monotonic() + timeout)
+            if tags is not None:
+                return character, tags
+        
+        # If all attempts failed, return a simple default
+        return candidates[-1], self.FALLBACK_TAGS
+    
+    def _fetch_character_tags_hedged(self, candidates: List[str], timeout: float) -> Tuple[str, str]:
+        """
+        Scrape up to hedge_width candidates concurrently under one overall deadline.
+        
+        The winner is the first candidate, in candidate order, whose tags pass
+        the tag-count check, so the result for a given seed does not depend on
+        which scrape happens to finish first. The remaining scrapes are
+        cancelled once the winner is known.
+        """
+        deadline = time.monotonic() + timeout
+        cancel = CancelToken()
+        pool = ThreadPoolExecutor(max_workers=min(self.hedge_width, len(candidates)))
+        futures = []
+        try:
+            for i, character in enumerate(candidates):
+                # Keep up to hedge_width candidates in flight, starting with this one
+                while len(futures) < min(len(candidates), i + self.hedge_width):
+                    if len(futures) > i and not self._can_hedge():
+                        break  # It would only queue behind the rate limiter
+                    futures.append(pool.submit(propagate(self._try_character), candidates[len(futures)],
+                                               deadline, cancel))
+                try:
+                    tags = futures[i].result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    continue  # The scrape itself reports the timeout
+                if tags is not None:
+                    return character, tags
+        finally:
+            cancel.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
         
         # If all attempts failed, return a simple default
-        return "character"
+        return candidates[-1], self.FALLBACK_TAGS
+    
+    def _can_hedge(self) -> bool:
+        """Whether an extra candidate's first requests would go out without waiting."""
+        if self.scraper_mode != "inprocess":
+            return True  # Each subprocess has its own limiter
+        requests = 1 if self.adaptive_pages or self.scraper_backend != "html" else self.scrape_pages
+        return available_requests(self.files["scraper"]) >= requests
     
     def _enhance_prompt_with_clothing(self, 
                                       start_prompts: List[str], 
                                       mid_prompts: List[str], 
                                       end_prompts: List[str],
-                                      partner: str) -> Tuple[List[str], List[str], List[str]]:
+                                      partner: str,
+                                      rng: random.Random) -> Tuple[List[str], List[str], List[str]]:
         """
         Enhance prompts with clothing information from the JSON configuration.
         
@@ -188,16 +419,18 @@ class PromptSceneGenerator:
             mid_prompts: List of middle prompts
             end_prompts: List of end prompts
             partner: Partner string to include in prompts (can include multiple options separated by /)
+            rng: Source of randomness
             
         Returns:
             Tuple of enhanced (start_prompts, mid_prompts, end_prompts)
         """
         # Split partner string into multiple options if they exist
         partner_options = [p.strip() for p in partner.split("/")] if partner else []
+        clothing_config = self.clothing_config
         
         # Generate random clothing combination
-        color = random.choice(self.clothing_config["start"]["colors"]) if self.clothing_config["start"]["colors"] else ""
-        clothing = random.choice(self.clothing_config["start"]["clothing"]) if self.clothing_config["start"]["clothing"] else ""
+        color = rng.choice(clothing_config["start"]["colors"]) if clothing_config["start"]["colors"] else ""
+        clothing = rng.choice(clothing_config["start"]["clothing"]) if clothing_config["start"]["clothing"] else ""
         outfit = f"{color}, {clothing}" if color and clothing else color or clothing
         
         # Enhanced start prompts with colors and clothing
@@ -209,10 +442,10 @@ class PromptSceneGenerator:
                 partner_text = ""
                 if i >= len(start_prompts) - max(1, len(start_prompts) // 4) and partner_options:
                     # Randomly select one partner option
-                    selected_partner = random.choice(partner_options)
-                    partner_text = f", {selected_partner}" if selected_partner else ""
+                    partner_text = rng.choice(partner_options)
                 
-                enhanced_start.append(f"{outfit}{partner_text}, {prompt}")
+                # Tags repeated between outfit, partner and line are kept once
+                enhanced_start.append(join_tags((outfit, partner_text, prompt)))
         
         # Enhance middle prompts with part1 and part2
         enhanced_mid = []
@@ -225,52 +458,71 @@ class PromptSceneGenerator:
             
             # Process part1 prompts
             for i in range(min(part1_count, len(mid_prompts))):
-                part1_item = random.choice(self.clothing_config["Mid"]["part1"]) if self.clothing_config["Mid"]["part1"] else ""
+                part1_item = rng.choice(clothing_config["Mid"]["part1"]) if clothing_config["Mid"]["part1"] else ""
                 
                 partner_text = ""
                 if partner_options:
                     # Randomly select one partner option
-                    selected_partner = random.choice(partner_options)
-                    partner_text = f", {selected_partner}" if selected_partner else ""
+                    partner_text = rng.choice(partner_options)
                 
                 # Add outfit to half of middle prompts
-                outfit_text = f"{outfit}, " if i < outfit_count else ""
+                outfit_text = outfit if i < outfit_count else ""
                 
-                enhanced_mid.append(f"{outfit_text}{part1_item}{partner_text}, {mid_prompts[i]}")
+                enhanced_mid.append(join_tags((outfit_text, part1_item, partner_text, mid_prompts[i])))
             
             # Process part2 prompts
             for i in range(part1_count, len(mid_prompts)):
-                part2_item = random.choice(self.clothing_config["Mid"]["part2"]) if self.clothing_config["Mid"]["part2"] else ""
+                part2_item = rng.choice(clothing_config["Mid"]["part2"]) if clothing_config["Mid"]["part2"] else ""
                 
                 partner_text = ""
                 if partner_options:
                     # Randomly select one partner option
-                    selected_partner = random.choice(partner_options)
-                    partner_text = f", {selected_partner}" if selected_partner else ""
+                    partner_text = rng.choice(partner_options)
                 
                 # Add outfit to half of middle prompts (continuing count from part1)
-                outfit_text = f"{outfit}, " if i - part1_count + part1_count < outfit_count else ""
+                outfit_text = outfit if i - part1_count + part1_count < outfit_count else ""
                 
-                enhanced_mid.append(f"{outfit_text}{part2_item}{partner_text}, {mid_prompts[i]}")
+                enhanced_mid.append(join_tags((outfit_text, part2_item, partner_text, mid_prompts[i])))
         
         # Enhance end prompts
         enhanced_end = []
         if end_prompts:
-            end_tag = self.clothing_config["end"].get("tag", "")
+            end_tag = clothing_config["end"].get("tag", "")
             
             for i, prompt in enumerate(end_prompts):
                 # Add partner to 1/4 of end prompts (at the beginning)
                 partner_text = ""
                 if i < max(1, len(end_prompts) // 4) and partner_options:
                     # Randomly select one partner option
-                    selected_partner = random.choice(partner_options)
-                    partner_text = f", {selected_partner}" if selected_partner else ""
+                    partner_text = rng.choice(partner_options)
                 
-                enhanced_end.append(f"{end_tag}{partner_text}, {prompt}")
+                enhanced_end.append(join_tags((end_tag, partner_text, prompt)))
         
         return enhanced_start, enhanced_mid, enhanced_end
     
-    def generate_scene_prompt(self, start: int, middle: int, end: int, partner: str = "") -> Dict[str, Any]:
+    def _build_scene_prompt(self, start: int, middle: int, end: int, partner: str, rng: random.Random,
+                            novelty: Optional[ProjectNovelty] = None) -> str:
+        """Select and enhance the scene lines, joined with the / separator."""
+        # Select random lines with context
+        with span("scene.select_lines", start=start, middle=middle, end=end):
+            start_prompts = self._select_random_lines_with_context('start', start, rng, novelty)
+            mid_prompts = self._select_random_lines_with_context('middle', middle, rng, novelty)
+            end_prompts = self._select_random_lines_with_context('end', end, rng, novelty)
+        
+        # Enhance prompts with clothing information
+        with span("scene.enhance_clothing"):
+            enhanced_start, enhanced_mid, enhanced_end = self._enhance_prompt_with_clothing(
+                start_prompts, mid_prompts, end_prompts, partner, rng
+            )
+        
+        # Combine all parts with / separator
+        all_prompts = enhanced_start + enhanced_mid + enhanced_end
+        return "/".join(all_prompts)
+    
+    def generate_scene_prompt(self, start: int, middle: int, end: int, partner: str = "",
+                              rng: Optional[random.Random] = None,
+                              novelty_project: Optional[str] = None,
+                              character: Optional[str] = None) -> Dict[str, Any]:
         """
         Generate a complete scene prompt based on input parameters.
         
@@ -279,34 +531,102 @@ class PromptSceneGenerator:
             middle: Number of lines to select from middle.txt
             end: Number of lines to select from end.txt
             partner: Partner string to include in prompts (can include multiple options separated by /)
+            rng: Source of randomness, e.g. random.Random(seed). Defaults to the global random module.
+            novelty_project: Project whose earlier scenes are remembered: lines and characters
+                it already used are skipped until each corpus runs out. None or empty to disable.
+            character: Character tag to use instead of a random one (see resolve_character).
+                Random candidates are still drawn, so the scene matches the one without it.
             
         Returns:
-            Dictionary with scenePrompt and characterTags
+            Dictionary with scenePrompt, characterTags, character and fallback, which is
+            True when every candidate failed and characterTags is FALLBACK_TAGS
         """
         # Ensure parameters are valid
         start = max(0, start)
         middle = max(0, middle)
         end = max(0, end)
         
-        # Select random lines with context
-        start_prompts = self._select_random_lines_with_context('start', start)
-        mid_prompts = self._select_random_lines_with_context('middle', middle)
-        end_prompts = self._select_random_lines_with_context('end', end)
-        
-        # Enhance prompts with clothing information
-        enhanced_start, enhanced_mid, enhanced_end = self._enhance_prompt_with_clothing(
-            start_prompts, mid_prompts, end_prompts, partner
-        )
+        if rng is None:
+            rng = random  # module-level functions share the global state
         
-        # Combine all parts with / separator
-        all_prompts = enhanced_start + enhanced_mid + enhanced_end
-        scene_prompt = "/".join(all_prompts)
+        novelty = self.get_novelty(novelty_project)
+        with novelty.lock if novelty is not None else nullcontext():
+            scene_prompt = self._build_scene_prompt(start, middle, end, partner, rng, novelty)
+            # A fixed character leaves the project's character pool untouched
+            candidates = self._pick_character_candidates(rng, novelty=None if character else novelty)
+            if novelty is not None:
+                novelty.save()
         
         # Get character tags
-        character_tags = self._get_character_tags()
+        character, character_tags = self._fetch_character_tags([character] if character else candidates)
         
         return {
             "scenePrompt": scene_prompt,
             "characterTags": character_tags,
-            "character": self.selected_character
-        }
\ No newline at end of file
+            "character": character,
+            "fallback": character_tags == self.FALLBACK_TAGS
+        }
+    
+    def generate_scene_prompts(self, count: int, start: int, middle: int, end: int,
+                               partner: str = "", max_workers: int = 8,
+                               rng: Optional[random.Random] = None,
+                               novelty_project: Optional[str] = None,
+                               character: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Generate several independent scene prompts in one call.
+        
+        All random choices (lines, clothing and candidate characters) are drawn
+        first, in order, so a batch of one matches generate_scene_prompt for
+        the same seed. The character tag lookups then run concurrently.
+        
+        Args:
+            count: Number of scenes to generate
+            start: Number of lines to select from start.txt per scene
+            middle: Number of lines to select from middle.txt per scene
+            end: Number of lines to select from end.txt per scene
+            partner: Partner string to include in prompts (can include multiple options separated by /)
+            max_workers: Maximum number of concurrent character tag lookups
+            rng: Source of randomness, e.g. random.Random(seed). Defaults to the global random module.
+            novelty_project: Project whose earlier scenes are remembered (see generate_scene_prompt)
+            character: Character tag used for every scene instead of random ones; its tags
+                are looked up once for the whole batch (see generate_scene_prompt)
+            
+        Returns:
+            List of dictionaries with scenePrompt, characterTags, character and fallback
+            (see generate_scene_prompt)
+        """
+        count = max(0, count)
+        start = max(0, start)
+        middle = max(0, middle)
+        end = max(0, end)
+        if rng is None:
+            rng = random
+        
+        scene_prompts = []
+        candidates = []
+        novelty = self.get_novelty(novelty_project)
+        with span("scene.draw", count=count), novelty.lock if novelty is not None else nullcontext():
+            for _ in range(count):
+                scene_prompts.append(self._build_scene_prompt(start, middle, end, partner, rng, novelty))
+                candidates.append(self._pick_character_candidates(rng, novelty=None if character else novelty))
+            if novelty is not None:
+                novelty.save()
+        
+        if count == 0:
+            return []
+        if character:
+            lookups = [self._fetch_character_tags([character])] * count
+        else:
+            with span("scene.character_lookups", count=count), \
+                    ThreadPoolExecutor(max_workers=max(1, min(max_workers, count))) as pool:
+                lookups = list(pool.map(propagate(self._fetch_character_tags), candidates))
+        
+        return [
+            {
+                "scenePrompt": scene_prompt,
+                "characterTags": character_tags,
+                "character": character,
+                "fallback": character_tags == self.FALLBACK_TAGS
+            }
+            for scene_prompt, (character, character_tags) in zip(scene_prompts, lookups)
+        ]
\ No newline at end of file
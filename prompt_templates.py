@@ -0,0 +1,183 @@
+"""
+Organization, workspace and prompt layout configuration.
+
+files/prompt_templates.json holds the organization table (style tags,
+hiresfix style tags, source link and logo), the workspace paths, the
+project types and the templates the packreator manager fills in. The file
+is checked and compiled once, and recompiled only when it changes.
+
+Text templates (title, save paths) are str.format strings. Tag templates
+are lists of pieces assembled with prompt_text.join_tags; a "{segment}"
+piece marks where each scene segment goes, so the pieces before and after
+it are filled and parsed once for a whole batch of segments.
+"""
+import string
+import threading
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Sequence, Tuple, Union
+
+from .corpus_cache import FileVersion, corpus_cache, file_version
+from .prompt_text import assemble_segments, join_tags
+
+DEFAULT_CONFIG = Path(__file__).parent / "files" / "prompt_templates.json"
+
+# Fields every template can use
+INPUT_FIELDS = (
+    "organization", "project_type", "workspace", "workspace_path", "character_name", "character_base",
+    "character_scene_details", "background", "final_details_quality_tags",
+)
+ORGANIZATION_FIELDS = ("style", "hiresfix_style", "source", "logo")
+# Text templates, rendered in this order; each one can use the ones before it
+TEXT_TEMPLATES = ("title", "base_savepath", "savepath_high_quality", "savepath_low_quality", "savepath_watermarked")
+TAG_TEMPLATES = ("character_prompt", "scene_prompt", "hiresfix_prompt")
+# Tag templates filled once per scene segment
+SEGMENT_TEMPLATES = ("scene_prompt", "hiresfix_prompt")
+SEGMENT = "{segment}"
+
+
+def _fields(template: str, where: str) -> List[str]:
+    """Names of the fields of a format string; ValueError for positional or malformed fields."""
+    try:
+        names = [name for _, name, _, _ in string.Formatter().parse(template) if name is not None]
+    except ValueError as e:
+        raise ValueError(f"{where}: {e}") from None
+    for name in names:
+        if not name.isidentifier():
+            raise ValueError(f"{where}: field {{{name}}} must be a plain name")
+    return names
+
+
+Formatter = Callable[[Mapping[str, str]], str]
+
+
+def _compile(template: str, known: Sequence[str], where: str) -> Formatter:
+    """
+    Check a format string against the known fields and return a function filling it.
+
+    A template that is a single field becomes an item lookup and one without
+    fields a constant; anything else is the bound str.format_map.
+    """
+    parts = list(string.Formatter().parse(template)) if template else []
+    for name in _fields(template, where):
+        if name not in known:
+            raise ValueError(f"{where}: unknown field {{{name}}}")
+    if len(parts) == 1 and not parts[0][0] and parts[0][1] and not parts[0][2] and not parts[0][3]:
+        return itemgetter(parts[0][1])
+    if all(name is None for _, name, _, _ in parts):
+        constant = template.format_map({})
+        return lambda values: constant
+    return template.format_map
+
+
+class TagTemplate:
+    """Compiled tag template: pieces before and after the optional {segment} piece."""
+
+    def __init__(self, pieces: Sequence[str], replace_underscores: bool, known: Sequence[str], where: str):
+        if not isinstance(pieces, list) or not all(isinstance(piece, str) for piece in pieces):
+            raise ValueError(f"{where}: 'tags' must be a list of strings")
+        if pieces.count(SEGMENT) > 1:
+            raise ValueError(f"{where}: {SEGMENT} can only appear once")
+        self.has_segment = SEGMENT in pieces
+        split = pieces.index(SEGMENT) if self.has_segment else len(pieces)
+        self.prefix = [_compile(piece, known, where) for piece in pieces[:split]]
+        self.suffix = [_compile(piece, known, where) for piece in pieces[split + 1:]]
+        self.replace_underscores = replace_underscores
+
+    def render(self, values: Mapping[str, str]) -> str:
+        """Fill the template (without segment) into one tag list."""
+        pieces = [fill(values) for fill in self.prefix + self.suffix]
+        return join_tags(pieces, self.replace_underscores)
+
+    def render_segments(self, values: Mapping[str, str], segments: Sequence[str]) -> List[str]:
+        """Fill the template once per segment; the other pieces are filled and parsed once."""
+        return assemble_segments([fill(values) for fill in self.prefix], segments,
+                                 [fill(values) for fill in self.suffix], self.replace_underscores)
+
+
+class PromptTemplates(NamedTuple):
+    organizations: Dict[str, Dict[str, str]]
+    workspaces: Dict[str, str]
+    project_types: List[str]
+    text: Dict[str, Formatter]
+    tags: Dict[str, TagTemplate]
+
+    def organization(self, name: str) -> Dict[str, str]:
+        """Fields of an organization; unknown organizations get empty fields."""
+        return self.organizations.get(name, dict.fromkeys(ORGANIZATION_FIELDS, ""))
+
+    def workspace_path(self, name: str) -> str:
+        try:
+            return self.workspaces[name]
+        except KeyError:
+            raise ValueError(f"Unknown workspace {name!r}; configured: {', '.join(self.workspaces)}") from None
+
+    def render_text(self, values: Dict[str, str]) -> Dict[str, str]:
+        """Render every text template in order, adding each result to values."""
+        for name in TEXT_TEMPLATES:
+            values[name] = self.text[name](values)
+        return values
+
+
+def compile_templates(config: Mapping[str, Any], where: str = "prompt templates") -> PromptTemplates:
+    """
+    Check a configuration and compile its templates.
+
+    Raises:
+        ValueError: Missing tables or templates, or a template using a field
+            that does not exist
+    """
+    for key, kind in (("organizations", dict), ("workspaces", dict), ("project_types", list), ("templates", dict)):
+        if not isinstance(config.get(key), kind):
+            raise ValueError(f"{where}: '{key}' must be a {'list' if kind is list else 'mapping'}")
+    organizations = {}
+    for name, org in config["organizations"].items():
+        if not isinstance(org, dict):
+            raise ValueError(f"{where}: organization {name!r} must be a mapping")
+        unknown = set(org) - set(ORGANIZATION_FIELDS)
+        if unknown:
+            raise ValueError(f"{where}: organization {name!r} has unknown keys {sorted(unknown)}")
+        organizations[name] = {field: str(org.get(field, "")) for field in ORGANIZATION_FIELDS}
+    templates = config["templates"]
+    missing = [name for name in TEXT_TEMPLATES + TAG_TEMPLATES if name not in templates]
+    if missing:
+        raise ValueError(f"{where}: missing templates {missing}")
+
+    known = list(INPUT_FIELDS) + list(ORGANIZATION_FIELDS)
+    text = {}
+    for name in TEXT_TEMPLATES:
+        template = templates[name]
+        if not isinstance(template, str):
+            raise ValueError(f"{where}: template {name!r} must be a string")
+        text[name] = _compile(template, known, f"{where}: template {name!r}")
+        known.append(name)
+    tags = {}
+    for name in TAG_TEMPLATES:
+        template = templates[name]
+        if not isinstance(template, dict):
+            raise ValueError(f"{where}: template {name!r} must be a mapping with 'tags'")
+        tags[name] = TagTemplate(template.get("tags"), bool(template.get("replace_underscores", False)),
+                                 known, f"{where}: template {name!r}")
+        if tags[name].has_segment != (name in SEGMENT_TEMPLATES):
+            raise ValueError(f"{where}: template {name!r} {'needs' if name in SEGMENT_TEMPLATES else 'cannot use'} "
+                             f"a {SEGMENT} piece")
+    return PromptTemplates(organizations, dict(config["workspaces"]), list(config["project_types"]), text, tags)
+
+
+_compiled: Dict[str, Tuple[FileVersion, PromptTemplates]] = {}
+_compiled_lock = threading.Lock()
+
+
+def get_templates(path: Union[str, Path, None] = None) -> PromptTemplates:
+    """Return the compiled templates of a configuration file, recompiled when it changes."""
+    path = DEFAULT_CONFIG if path is None else path
+    key = str(path)
+    version = file_version(path)
+    entry = _compiled.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+    with _compiled_lock:
+        entry = _compiled.get(key)
+        if entry is None or entry[0] != version:
+            entry = _compiled[key] = (version, compile_templates(corpus_cache.get_json(path), str(path)))
+        return entry[1]
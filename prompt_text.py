@@ -0,0 +1,165 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+# Tag-level assembly: prompts are built from pieces (character base, scene
+# segment, details, quality tags...) that often repeat each other's tags.
+
+_OPEN = "([{"
+_CLOSE = ")]}"
+_SPACES_RE = re.compile(r"\s+")
+_PIPES_RE = re.compile(r"\|{2,}")
+_WEIGHT_RE = re.compile(r":\s*(-?\d+(?:\.\d+)?)$")
+# A parenthesis not already escaped
+_LITERAL_PAREN_RE = re.compile(r"(?<!\\)([()])")
+# Danbooru qualifiers: saber_(fate) anywhere in a tag, saber (fate) at its end
+_QUALIFIER_RE = re.compile(r"(?<=_)\(([^(),\\]*)\)")
+_TRAILING_QUALIFIER_RE = re.compile(r"(?<= )\(([^(),\\]*)\)$")
+# Prompt keyword starting a new chunk: every occurrence is kept
+_BREAK = "BREAK"
+
+
+class Tag(NamedTuple):
+    key: str        # Identity used for deduplication: no emphasis, escapes or '_', lower case
+    text: str       # Canonical text, with its emphasis and escaped literal parentheses
+    weighted: bool  # Wrapped in emphasis brackets
+
+
+def _closing(text: str, start: int) -> int:
+    """Index of the bracket closing the one at start, or -1."""
+    depth = 0
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch in _OPEN:
+            depth += 1
+        elif ch in _CLOSE:
+            depth -= 1
+            if not depth:
+                return i
+        i += 1
+    return -1
+
+
+def _split_tags(piece: str) -> List[str]:
+    """Split a piece on the commas outside brackets."""
+    if not any(ch in piece for ch in "([{\\"):
+        return piece.split(",")
+    tags = []
+    depth = start = 0
+    i = 0
+    while i < len(piece):
+        ch = piece[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch in _OPEN:
+            depth += 1
+        elif ch in _CLOSE:
+            depth = max(0, depth - 1)
+        elif ch == "," and not depth:
+            tags.append(piece[start:i])
+            start = i + 1
+        i += 1
+    if depth:
+        # Unbalanced bracket (e.g. the :( emoticon): brackets cannot group anything
+        return piece.split(",")
+    tags.append(piece[start:])
+    return tags
+
+
+def _parse_tag(raw: str, replace_underscores: bool, emphasis: bool) -> Optional[Tag]:
+    if emphasis and "_(" in raw:
+        raw = _QUALIFIER_RE.sub(r"\\(\1\\)", raw)
+    text = raw.replace("_", " ") if replace_underscores else raw
+    text = _PIPES_RE.sub("|", _SPACES_RE.sub(" ", text)).strip()
+    if not text:
+        return None
+    # Peel emphasis: (tag), ((tag)), [tag], {tag}, (tag:1.2)
+    opens = ""
+    while emphasis and len(text) > 1 and text[0] in _OPEN and _closing(text, 0) == len(text) - 1:
+        opens += text[0]
+        text = text[1:-1].strip()
+    weight = ""
+    if opens.endswith("("):
+        match = _WEIGHT_RE.search(text)
+        if match:
+            weight = ":" + match.group(1)
+            text = text[:match.start()].rstrip()
+    if not text:
+        return None
+    if not emphasis:
+        text = _LITERAL_PAREN_RE.sub(r"\\\1", text)
+    else:
+        # A qualifier is part of the name, e.g. 2b_(nier:automata) or saber (fate);
+        # other parentheses stay emphasis, e.g. a (b) c or :(
+        text = _TRAILING_QUALIFIER_RE.sub(r"\\(\1\\)", text)
+    key = text.replace("\\", "").replace("_", " ").lower()
+    closes = "".join(_CLOSE[_OPEN.index(ch)] for ch in reversed(opens))
+    return Tag(key, f"{opens}{text}{weight}{closes}", bool(opens))
+
+
+@lru_cache(maxsize=16384)
+def parse_tags(piece: str, replace_underscores: bool = False, emphasis: bool = True) -> Tuple[Tag, ...]:
+    """
+    Parse a comma-separated prompt piece into canonical tags.
+
+    Whitespace is collapsed, empty tags are dropped, emphasis groups are kept
+    whole and the parentheses of Danbooru qualifiers, such as saber_(fate), are
+    escaped once (already escaped ones are left alone). With
+    replace_underscores, '_' becomes a space. With emphasis=False (plain
+    Danbooru tags) brackets never group tags and every parenthesis is literal.
+    """
+    raw_tags = _split_tags(piece) if emphasis else piece.split(",")
+    tags = (_parse_tag(raw, replace_underscores, emphasis) for raw in raw_tags)
+    return tuple(tag for tag in tags if tag is not None)
+
+
+def _add_tags(kept: Dict[str, Tag], tags: Iterable[Tag]) -> None:
+    for tag in tags:
+        if tag.text == _BREAK:
+            kept[f"{_BREAK} {len(kept)}"] = tag  # Upper case: no tag key can collide
+            continue
+        previous = kept.setdefault(tag.key, tag)
+        # The first occurrence keeps its place; an emphasized repeat lends it its emphasis
+        if tag.weighted and not previous.weighted:
+            kept[tag.key] = tag
+
+
+def join_tags(pieces: Iterable[str], replace_underscores: bool = False, emphasis: bool = True,
+              separator: str = ", ") -> str:
+    """
+    Assemble prompt pieces into one tag list, without repeated tags.
+
+    Tags keep the order of their first occurrence; a repeat that carries
+    emphasis replaces an unemphasized first occurrence in place. BREAK is
+    never deduplicated. See
+    parse_tags for replace_underscores and emphasis.
+    """
+    kept: Dict[str, Tag] = {}
+    for piece in pieces:
+        _add_tags(kept, parse_tags(piece, replace_underscores, emphasis))
+    return separator.join([tag.text for tag in kept.values()])
+
+
+def assemble_segments(prefix: Sequence[str], segments: Sequence[str], suffix: Sequence[str],
+                      replace_underscores: bool = False, separator: str = ", ") -> List[str]:
+    """
+    join_tags(prefix + [segment] + suffix) for every segment.
+
+    The prefix and suffix pieces are parsed once for the whole batch.
+    """
+    head: Dict[str, Tag] = {}
+    for piece in prefix:
+        _add_tags(head, parse_tags(piece, replace_underscores))
+    tail = [tag for piece in suffix for tag in parse_tags(piece, replace_underscores)]
+    prompts = []
+    for segment in segments:
+        kept = dict(head)
+        _add_tags(kept, parse_tags(segment, replace_underscores))
+        _add_tags(kept, tail)
+        prompts.append(separator.join([tag.text for tag in kept.values()]))
+    return prompts
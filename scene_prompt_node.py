@@ -1,8 +1,57 @@
 from .prompt_scene_generator import PromptSceneGenerator
+from .prompt_text import join_tags
+from .tracing import span
+from collections import OrderedDict
+import hashlib
 import random
 import re
+import threading
 
 class ScenePromptNode:
+    # Generator shared by every execution; its data files are cached process-wide
+    _generator = None
+    
+    # Últimas saídas, por entradas + versão dos arquivos de dados (LRU limitado)
+    MEMO_SIZE = 128
+    _memo = OrderedDict()
+    _memo_lock = threading.Lock()
+    
+    @classmethod
+    def get_generator(cls) -> PromptSceneGenerator:
+        """Return the shared PromptSceneGenerator, creating it on first use."""
+        if cls._generator is None:
+            cls._generator = PromptSceneGenerator()
+        return cls._generator
+    
+    @classmethod
+    def memo_key(cls, start_count, middle_count, end_count, partner_text, seed, characterName="",
+                 characterTags="", batch_size=1, novelty_project="") -> tuple:
+        """
+        Chave de memoização: todas as entradas mais a versão dos arquivos de dados,
+        então editar start/middle/end/clothing/lista de personagens muda a chave.
+        """
+        return (start_count, middle_count, end_count, partner_text, seed, characterName, characterTags,
+                batch_size, novelty_project, cls.get_generator().corpus_version())
+    
+    @classmethod
+    def IS_CHANGED(cls, start_count, middle_count, end_count, partner_text, seed, characterName="",
+                   characterTags="", batch_size=1, novelty_project=""):
+        """
+        Permite ao cache de execução do ComfyUI pular o nó enquanto as entradas e
+        os arquivos de dados não mudarem.
+        Só há hash estável quando a saída dessas entradas está memoizada: uma execução
+        que caiu nas tags de reserva (raspagens falharam) não é memoizada e roda de novo.
+        """
+        if novelty_project.strip():
+            # Com novidade cada execução sorteia outras linhas: NaN nunca é igual e força a execução
+            return float("nan")
+        key = cls.memo_key(start_count, middle_count, end_count, partner_text, seed, characterName,
+                           characterTags, batch_size, novelty_project)
+        with cls._memo_lock:
+            if key not in cls._memo:
+                return float("nan")
+        return hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    
     @classmethod
     def INPUT_TYPES(s):
         return {
@@ -16,11 +65,14 @@ class ScenePromptNode:
             "optional": {
                 "characterName": ("STRING", {"multiline": True, "default": ""}),
                 "characterTags": ("STRING", {"multiline": True, "default": ""}),
+                "batch_size": ("INT", {"default": 1, "min": 1, "max": 1000}),
+                "novelty_project": ("STRING", {"default": ""}),
             }
         }
     
     RETURN_TYPES = ("STRING", "STRING", "STRING")
     RETURN_NAMES = ("character", "characterTags", "scenePrompt")
+    OUTPUT_IS_LIST = (True, True, True)
     FUNCTION = "generate_scene_prompt"
     CATEGORY = "text/prompt"
     
@@ -45,39 +97,89 @@ class ScenePromptNode:
     def escape_parentheses_in_tags(self, tags: str) -> str:
         """
         Escapa parênteses em tags adicionando uma barra invertida antes de '(' e ')'.
+        Parênteses já escapados não são escapados de novo, e tags repetidas ou vazias são removidas.
         """
-        # Divide as tags por vírgula
-        tag_list = [tag.strip() for tag in tags.split(',')]
-        corrected_tags = []
-        for tag in tag_list:
-            # Escapa '(' e ')'
-            corrected_tag = tag.replace('(', '\\(').replace(')', '\\)')
-            corrected_tags.append(corrected_tag)
-        # Junta as tags corrigidas em uma string
-        return ', '.join(corrected_tags)
+        return join_tags([tags], emphasis=False)
     
-    def generate_scene_prompt(self, start_count, middle_count, end_count, partner_text, seed, characterName="", characterTags=""):
+    def generate_scene_prompt(self, start_count, middle_count, end_count, partner_text, seed, characterName="", characterTags="", batch_size=1, novelty_project=""):
         """
-        Gera o prompt da cena e as tags do personagem, com limpezas e correções aplicadas.
+        Gera batch_size prompts de cena e as tags dos personagens, com limpezas e correções aplicadas.
+        Cada saída é uma lista com um item por cena.
+        Resultados ficam memoizados enquanto as entradas e os arquivos de dados não mudarem.
+        Com novelty_project, linhas e personagens já usados nesse projeto são evitados
+        (em execuções seguintes também) e nada é memoizado.
         """
-        # Define a semente para resultados diferentes com sementes diferentes
-        random.seed(seed)
+        if novelty_project.strip():
+            outputs, _ = self._generate(start_count, middle_count, end_count, partner_text, seed, characterName,
+                                        characterTags, batch_size, novelty_project)
+            return tuple(list(output) for output in outputs)
         
-        generator = PromptSceneGenerator()
-        result = generator.generate_scene_prompt(start_count, middle_count, end_count, partner_text)
-        
-        # Usa o characterName fornecido se não estiver vazio, senão usa o gerado
-        final_character = characterName if characterName.strip() else result["character"]
-        # Limpa o nome do personagem
-        final_character = self.clean_character_name(final_character)
+        key = self.memo_key(start_count, middle_count, end_count, partner_text, seed, characterName,
+                            characterTags, batch_size, novelty_project)
+        with self._memo_lock:
+            outputs = self._memo.get(key)
+            if outputs is not None:
+                self._memo.move_to_end(key)
+        if outputs is None:
+            outputs, complete = self._generate(start_count, middle_count, end_count, partner_text, seed,
+                                               characterName, characterTags, batch_size)
+            if not complete:
+                # Tags de reserva: não memoiza, a próxima execução tenta raspar de novo
+                return tuple(list(output) for output in outputs)
+            with self._memo_lock:
+                self._memo[key] = outputs
+                self._memo.move_to_end(key)
+                while len(self._memo) > self.MEMO_SIZE:
+                    self._memo.popitem(last=False)
+        # Cópias: quem recebe as listas pode alterá-las sem afetar o cache
+        return tuple(list(output) for output in outputs)
+    
+    def _generate(self, start_count, middle_count, end_count, partner_text, seed, characterName, characterTags,
+                  batch_size, novelty_project=""):
+        """
+        Gera as saídas do nó sem passar pelo cache.
+        Devolve (saídas, completa); completa é False se alguma cena ficou com as tags
+        de reserva porque todas as raspagens falharam (e characterTags não foi dado).
+        """
+        # Gerador aleatório próprio da execução: a semente não afeta o estado global
+        # e execuções simultâneas não interferem umas nas outras
+        rng = random.Random(seed)
         
-        # Usa as characterTags fornecidas se não estiverem vazias, senão usa as geradas
-        final_characterTags = characterTags if characterTags.strip() else result["characterTags"]
-        # Corrige os parênteses nas tags
-        final_characterTags = self.escape_parentheses_in_tags(final_characterTags)
+        generator = self.get_generator()
+        # Nome digitado sem tags: busca as tags da tag do personagem (ex.: "2B (NieR:Automata)" ->
+        # 2b_(nier:automata)) em vez das de um personagem aleatório
+        character = None
+        if characterName.strip() and not characterTags.strip():
+            character = generator.resolve_character(characterName)
+            if character is None:
+                suggestions = ", ".join(tag for tag, _ in generator.suggest_characters(characterName))
+                print(f"Personagem '{characterName.strip()}' não encontrado na lista; usando tags de personagens "
+                      f"aleatórios. Sugestões: {suggestions or 'nenhuma'}")
+        # Etapa raiz do trace opcional (ver tracing.py)
+        with span("node.generate_scene_prompt", seed=seed, batch_size=batch_size):
+            results = generator.generate_scene_prompts(batch_size, start_count, middle_count, end_count,
+                                                       partner_text, rng=rng, novelty_project=novelty_project,
+                                                       character=character)
         
-        final_scenePrompt = result["scenePrompt"]
-        # Remove vírgulas duplicadas do prompt
-        final_scenePrompt = self.remove_duplicate_commas(final_scenePrompt)
+        characters, characterTags_list, scenePrompts = [], [], []
+        for result in results:
+            # Usa o characterName fornecido se não estiver vazio, senão usa o gerado
+            final_character = characterName if characterName.strip() else result["character"]
+            # Limpa o nome do personagem
+            final_character = self.clean_character_name(final_character)
+            
+            # Usa as characterTags fornecidas se não estiverem vazias, senão usa as geradas
+            final_characterTags = characterTags if characterTags.strip() else result["characterTags"]
+            # Corrige os parênteses nas tags
+            final_characterTags = self.escape_parentheses_in_tags(final_characterTags)
+            
+            final_scenePrompt = result["scenePrompt"]
+            # Remove vírgulas duplicadas do prompt
+            final_scenePrompt = self.remove_duplicate_commas(final_scenePrompt)
+            
+            characters.append(final_character)
+            characterTags_list.append(final_characterTags)
+            scenePrompts.append(final_scenePrompt)
         
-        return (final_character, final_characterTags, final_scenePrompt)
\ No newline at end of file
+        complete = bool(characterTags.strip()) or not any(result["fallback"] for result in results)
+        return (characters, characterTags_list, scenePrompts), complete
\ No newline at end of file
@@ -0,0 +1,157 @@
+import importlib.util
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from types import ModuleType
+from typing import Callable, Dict, List, Mapping, Optional, Union
+
+from . import tracing
+
+_modules: Dict[str, ModuleType] = {}
+_modules_lock = threading.Lock()
+
+
+class ScraperUnavailable(Exception):
+    """The scraper refused to run because Danbooru keeps failing (circuit open)."""
+
+
+class ScraperBusy(TimeoutError):
+    """The scrape ran out of time waiting in this process (rate limiter, worker pool), not on Danbooru."""
+
+
+class CancelToken:
+    """
+    Cancellation signal shared by the scrapes of one character lookup.
+
+    The in-process scraper polls ``is_set()``; subprocess scrapes register
+    a callback that kills their interpreter.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def is_set(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """Signal cancellation and run the registered callbacks."""
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run callback on cancellation (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+
+def load_scraper(scraper_path: Union[str, Path]) -> ModuleType:
+    """
+    Import the Danbooru scraper script as a module, once per process.
+
+    Keeping the module loaded keeps its ``requests.Session`` (and the
+    connections in its pool) warm across calls. The scraper's ``span`` hook
+    is pointed at ``tracing.span``, so its stages show up in the trace.
+    """
+    key = str(Path(scraper_path).resolve())
+    with _modules_lock:
+        module = _modules.get(key)
+        if module is None:
+            spec = importlib.util.spec_from_file_location("packreator_danbooru_scraper", key)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.span = tracing.span
+            _modules[key] = module
+        return module
+
+
+def scrape_in_process(scraper_path: Union[str, Path], character: str, pages: int, timeout: float,
+                      cancel: Optional[CancelToken] = None, adaptive: bool = False,
+                      backend: str = "html",
+                      on_counts: Optional[Callable[[Mapping[str, int], int], None]] = None) -> str:
+    """
+    Scrape the tags of a character inside the current process.
+
+    ``backend`` selects the HTML listing ("html") or the posts JSON API ("json").
+
+    With ``adaptive``, HTML pages are fetched one at a time and the scrape
+    stops as soon as the selected tags are settled, with ``pages`` as the cap.
+    Adaptive scraping only exists for the HTML backend.
+
+    ``on_counts`` is called with the raw tag counts and the number of posts
+    before the tags are selected (see tag_counts.py).
+
+    Raises:
+        TimeoutError: If the ``timeout`` seconds ran out while waiting on Danbooru
+            (a response or a page body), with no request held by the rate limiter
+        ScraperBusy: If the time ran out otherwise, e.g. after any wait in this
+            process's rate limiter or worker queue
+        ScraperUnavailable: If the scraper's circuit breaker is open
+        ValueError: If adaptive is combined with the "json" backend
+    """
+    if adaptive and backend != "html":
+        raise ValueError(f"Adaptive scraping needs the html backend, not {backend!r}")
+    scraper = load_scraper(scraper_path)
+    try:
+        if adaptive:
+            tags, pages_used = scraper.get_character_tags_adaptive(
+                character, max_pages=pages, timeout=timeout, cancel=cancel, on_counts=on_counts
+            )
+            print(f"Scraped {pages_used}/{pages} pages for character: {character}")
+            return tags.strip()
+        return scraper.get_character_tags(character, pages, timeout=timeout, cancel=cancel, backend=backend,
+                                          on_counts=on_counts).strip()
+    except scraper.ScrapeUnavailable as e:
+        raise ScraperUnavailable(str(e)) from e
+    except scraper.ScrapeTimeout as e:
+        if e.upstream:
+            raise
+        raise ScraperBusy(str(e)) from e
+
+
+def available_requests(scraper_path: Union[str, Path]) -> float:
+    """
+    Requests the in-process scraper's rate limiter would let through right now.
+
+    Infinite if the scraper cannot be imported here (scrapes then run in
+    subprocesses, each with its own limiter).
+    """
+    try:
+        scraper = load_scraper(scraper_path)
+    except ImportError:
+        return float("inf")
+    return scraper.limiter.available()
+
+
+def scrape_subprocess(scraper_path: Union[str, Path], character: str, pages: int, timeout: float,
+                      cancel: Optional[CancelToken] = None) -> str:
+    """
+    Scrape the tags of a character by running the scraper script in a new interpreter.
+
+    Raises:
+        TimeoutError: If the script did not finish within ``timeout`` seconds
+    """
+    with tracing.span("scraper.subprocess", character=character, pages=pages):
+        process = subprocess.Popen(
+            [sys.executable, str(scraper_path), character, str(pages)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        if cancel is not None:
+            cancel.on_cancel(process.kill)
+        try:
+            stdout, _ = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise TimeoutError(f"scraper timed out after {timeout}s")
+        return stdout.strip()
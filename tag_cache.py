@@ -0,0 +1,153 @@
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+
+class CharacterTagCache:
+    """
+    Persistent cache for scraped character tags, shared between processes.
+
+    Entries are stored in a SQLite database in WAL mode, keyed by the
+    character tag, the number of scraped pages and the source of the scrape
+    ("html", "json" or "adaptive"), and hold the final ``process_tags``
+    string together with the time it was stored.
+    """
+
+    DEFAULT_TTL = 7 * 24 * 60 * 60  # one week
+
+    def __init__(self, db_path: Union[str, Path], ttl: float = DEFAULT_TTL):
+        """
+        Open (or create) the cache database.
+
+        Args:
+            db_path: Path of the SQLite database file
+            ttl: Time in seconds after which an entry is considered expired
+        """
+        self.db_path = Path(db_path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "stale": 0}
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("BEGIN IMMEDIATE")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(character_tags)")}
+        if columns and "source" not in columns:
+            # Older entries do not say which scrape produced them
+            self._conn.execute("DROP TABLE character_tags")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS character_tags ("
+            " character TEXT NOT NULL,"
+            " pages INTEGER NOT NULL,"
+            " source TEXT NOT NULL,"
+            " tags TEXT NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " PRIMARY KEY (character, pages, source))"
+        )
+        self._conn.commit()
+
+    def get(self, character: str, pages: int = 3, allow_expired: bool = False,
+            source: str = "html") -> Optional[str]:
+        """
+        Look up the cached tags of a character.
+
+        Args:
+            character: Danbooru character tag
+            pages: Number of pages the tags were scraped from (the page cap
+                for adaptive scrapes)
+            allow_expired: Also return expired entries (e.g. as a fallback
+                when the scraper is unavailable)
+            source: How the tags were scraped: "html", "json" or "adaptive"
+
+        Returns:
+            The cached tags, or None if missing or expired
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tags, stored_at FROM character_tags WHERE character = ? AND pages = ? AND source = ?",
+                (character, pages, source),
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            tags, stored_at = row
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                if allow_expired:
+                    self._stats["stale"] += 1
+                    return tags
+                self._stats["expired"] += 1
+                return None
+            self._stats["hits"] += 1
+            return tags
+
+    def set(self, character: str, tags: str, pages: int = 3, source: str = "html") -> None:
+        """Store the tags of a character, replacing any previous entry for the same pages and source."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO character_tags (character, pages, source, tags, stored_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (character, pages, source, tags, time.time()),
+            )
+            self._conn.commit()
+
+    def invalidate(self, character: str, pages: Optional[int] = None) -> int:
+        """
+        Remove the entries of one character.
+
+        Args:
+            character: Danbooru character tag
+            pages: Only remove the entries for this page count; all page counts if None
+
+        Returns:
+            Number of removed entries
+        """
+        with self._lock:
+            if pages is None:
+                cursor = self._conn.execute(
+                    "DELETE FROM character_tags WHERE character = ?", (character,)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM character_tags WHERE character = ? AND pages = ?", (character, pages)
+                )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._conn.execute("DELETE FROM character_tags")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss/expired counters of this instance."""
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+_shared_caches: Dict[Tuple[str, Optional[float]], CharacterTagCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_tag_cache(db_path: Union[str, Path], ttl: float = CharacterTagCache.DEFAULT_TTL) -> CharacterTagCache:
+    """
+    Return the process-wide cache instance for a database path and TTL.
+
+    Callers asking for another TTL get their own instance on the same
+    database, so no caller changes the expiry another one relies on.
+    """
+    key = (str(Path(db_path).resolve()), ttl)
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = _shared_caches[key] = CharacterTagCache(db_path, ttl)
+        return cache
@@ -0,0 +1,277 @@
+"""
+Raw tag frequencies of scraped characters.
+
+process_tags keeps a dozen tags per character and drops the counts, so
+tuning the selection (KEYWORDS, the half-of-posts threshold, the 8 + 2
+limits, EXCLUDED_RE) used to mean scraping every character again. In-process
+scrapes also hand their counts to this store. For each character it keeps
+the number of posts and the (tag id, count) pairs in first-seen order, with
+tag names interned in a shared vocabulary. process_all then replays the
+selection over every stored character at once with numpy.
+
+tag_profiles.py uses it to rebuild the profile index without scraping:
+    python -m Packreator_manager.tag_profiles reselect [--threshold 0.5] [--related 8] [--additional 2]
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Pattern, Tuple, Union
+
+import numpy as np
+
+SCRAPER = Path(__file__).parent / "files" / "danbooru_scraper.py"
+
+_ID = np.dtype("<u4")
+_COUNT = np.dtype("<u4")
+_SQL_VARIABLES = 500     # Tags looked up per query, under SQLite's parameter limit
+
+
+class TagCountMatrix(NamedTuple):
+    """Counts of many characters, concatenated: character i owns entries offsets[i]:offsets[i + 1]."""
+    characters: List[str]
+    posts: np.ndarray        # Posts counted per character
+    fetched_at: np.ndarray
+    offsets: np.ndarray
+    tag_ids: np.ndarray      # Vocabulary ids, in first-seen order per character
+    counts: np.ndarray
+    vocabulary: List[str]    # Tag of each id
+
+
+class TagCountStore:
+    """
+    Persistent tag counts per character, shared between processes.
+
+    Stored in a SQLite database in WAL mode: a vocabulary table interning
+    tag names and one row per character with its post count and the tag ids
+    and counts as little-endian uint32 blobs. Recording a character replaces
+    its previous counts.
+    """
+
+    def __init__(self, db_path: Union[str, Path]):
+        """
+        Open (or create) the store.
+
+        Args:
+            db_path: Path of the SQLite database file
+        """
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self._ids: Dict[str, int] = {}
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS vocabulary (id INTEGER PRIMARY KEY, tag TEXT NOT NULL UNIQUE)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tag_counts ("
+            " character TEXT PRIMARY KEY,"
+            " posts INTEGER NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " tag_ids BLOB NOT NULL,"
+            " counts BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _intern(self, tags: Iterable[str]) -> None:
+        """Make sure every tag has a vocabulary id in self._ids (lock held)."""
+        missing = [tag for tag in tags if tag not in self._ids]
+        if not missing:
+            return
+        self._conn.executemany("INSERT OR IGNORE INTO vocabulary (tag) VALUES (?)", ((tag,) for tag in missing))
+        # Ids may have been given by another process, so read them back
+        for i in range(0, len(missing), _SQL_VARIABLES):
+            chunk = missing[i:i + _SQL_VARIABLES]
+            rows = self._conn.execute(
+                f"SELECT tag, id FROM vocabulary WHERE tag IN ({', '.join('?' * len(chunk))})", chunk)
+            self._ids.update(rows)
+
+    def record(self, character: str, counts: Mapping[str, int], posts: int,
+               fetched_at: Optional[float] = None) -> None:
+        """
+        Store the tag counts of a character, replacing any previous ones.
+
+        Args:
+            character: Danbooru character tag
+            counts: Posts each tag appeared in, in first-seen order (a Counter
+                keeps it, and the selection breaks ties by it)
+            posts: Number of posts counted; nothing is stored for 0
+            fetched_at: Time the posts were scraped. Defaults to now.
+        """
+        if posts <= 0:
+            return
+        with self._lock:
+            self._intern(counts)
+            tag_ids = np.fromiter((self._ids[tag] for tag in counts), _ID, len(counts))
+            values = np.fromiter(counts.values(), _COUNT, len(counts))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tag_counts (character, posts, fetched_at, tag_ids, counts)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (character, posts, time.time() if fetched_at is None else fetched_at,
+                 tag_ids.tobytes(), values.tobytes()),
+            )
+            self._conn.commit()
+
+    def get(self, character: str) -> Optional[Tuple[Counter, int]]:
+        """Return (counts in first-seen order, posts) of a character, or None if not stored."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT posts, tag_ids, counts FROM tag_counts WHERE character = ?", (character,)).fetchone()
+            if row is None:
+                return None
+            posts, tag_ids, counts = row
+            tag_ids = np.frombuffer(tag_ids, _ID).tolist()
+            rows = dict(self._conn.execute(
+                f"SELECT id, tag FROM vocabulary WHERE id IN ({', '.join(map(str, set(tag_ids)))})"))
+        return Counter(dict(zip((rows[i] for i in tag_ids), np.frombuffer(counts, _COUNT).tolist()))), posts
+
+    def load(self, characters: Optional[Iterable[str]] = None) -> TagCountMatrix:
+        """
+        Read the counts of many characters into one TagCountMatrix.
+
+        Args:
+            characters: Characters to read, in this order; missing ones are
+                skipped. All stored characters, by name, if None.
+        """
+        with self._lock:
+            vocabulary = [""] * (self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM vocabulary").fetchone()[0] + 1)
+            for tag_id, tag in self._conn.execute("SELECT id, tag FROM vocabulary"):
+                vocabulary[tag_id] = tag
+            rows = self._conn.execute(
+                "SELECT character, posts, fetched_at, tag_ids, counts FROM tag_counts ORDER BY character").fetchall()
+        if characters is not None:
+            by_name = {row[0]: row for row in rows}
+            rows = [by_name[c] for c in dict.fromkeys(characters) if c in by_name]
+        lengths = np.fromiter((len(row[3]) // _ID.itemsize for row in rows), np.int64, len(rows))
+        offsets = np.zeros(len(rows) + 1, np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return TagCountMatrix(
+            characters=[row[0] for row in rows],
+            posts=np.fromiter((row[1] for row in rows), np.int64, len(rows)),
+            fetched_at=np.fromiter((row[2] for row in rows), np.float64, len(rows)),
+            offsets=offsets,
+            tag_ids=np.frombuffer(b"".join(row[3] for row in rows), _ID),
+            counts=np.frombuffer(b"".join(row[4] for row in rows), _COUNT),
+            vocabulary=vocabulary,
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tag_counts").fetchone()[0]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+_shared_stores: Dict[str, TagCountStore] = {}
+_shared_lock = threading.Lock()
+
+
+def get_tag_count_store(db_path: Union[str, Path]) -> TagCountStore:
+    """Return the process-wide store instance for a database path."""
+    key = str(Path(db_path).resolve())
+    with _shared_lock:
+        store = _shared_stores.get(key)
+        if store is None:
+            store = _shared_stores[key] = TagCountStore(db_path)
+        return store
+
+
+def _vocabulary_mask(vocabulary: List[str], pattern: Optional[Pattern], search: bool) -> np.ndarray:
+    """Which vocabulary tags a pattern matches (searched anywhere, or matched at the start)."""
+    if pattern is None:
+        return np.zeros(len(vocabulary), bool)
+    test = pattern.search if search else pattern.match
+    return np.fromiter((test(tag) is not None for tag in vocabulary), bool, len(vocabulary))
+
+
+def _rank_in_group(mask: np.ndarray, group: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """For entries sorted by group, how many earlier entries of the same group are in mask."""
+    before = np.zeros(len(mask) + 1, np.int64)
+    np.cumsum(mask, out=before[1:])
+    return before[:-1] - before[starts][group]
+
+
+def process_all(matrix: TagCountMatrix, keywords: Optional[Iterable[str]] = None,
+                excluded: Union[str, Pattern, None] = None, threshold: float = 0.5,
+                max_related: int = 8, max_additional: int = 2) -> Dict[str, str]:
+    """
+    Select the tags of every character in a matrix, like the scraper's process_tags.
+
+    The selection is the scraper's select_tags, done for all characters
+    with whole-array operations: tags in at least threshold of the posts
+    are "frequent"; the result is the character tag, 1girl or 1boy if
+    frequent, the max_related most frequent tags containing a keyword, and
+    the max_additional most common other tags not matching excluded.
+    Ties keep first-seen order, as Counter.most_common does.
+
+    Args:
+        matrix: Counts from TagCountStore.load
+        keywords: Substrings of the related tags. Defaults to the scraper's KEYWORDS.
+        excluded: Tags never added as additional. Defaults to the scraper's EXCLUDED_RE.
+        threshold: Share of the posts a tag must appear in to be frequent
+        max_related: Maximum number of keyword tags
+        max_additional: Maximum number of other tags
+
+    Returns:
+        Mapping of character to its comma-separated tags
+    """
+    if keywords is None or excluded is None:
+        from .scraper_client import load_scraper
+        scraper = load_scraper(SCRAPER)
+        keywords = scraper.KEYWORDS if keywords is None else keywords
+        excluded = scraper.EXCLUDED_RE if excluded is None else excluded
+    keywords = sorted(set(keywords))
+    keyword_re = re.compile("|".join(map(re.escape, keywords))) if keywords else None
+    excluded_re = re.compile(excluded) if isinstance(excluded, str) else excluded
+
+    vocabulary = matrix.vocabulary
+    is_keyword = _vocabulary_mask(vocabulary, keyword_re, search=True)
+    is_excluded = _vocabulary_mask(vocabulary, excluded_re, search=False)
+    tag_id = {tag: i for i, tag in enumerate(vocabulary)}
+    n = len(matrix.characters)
+    starts = matrix.offsets[:-1]
+    group = np.repeat(np.arange(n), np.diff(matrix.offsets))
+    counts = matrix.counts.astype(np.int64)
+    ids = matrix.tag_ids.astype(np.int64)
+
+    # Counts high to low within each character; the stable sort keeps first-seen order on ties
+    top = int(counts.max(initial=0))
+    order = np.argsort(group * (top + 1) + (top - counts), kind="stable")
+    ids, counts, group = ids[order], counts[order], group[order]
+
+    half = np.ceil(matrix.posts * threshold).astype(np.int64)
+    frequent = counts >= half[group]
+    own = np.array([tag_id.get(c, -1) for c in matrix.characters], np.int64)
+
+    related = frequent & is_keyword[ids]
+    related &= _rank_in_group(related, group, starts) < max_related
+    additional = ~related & (ids != own[group]) & ~is_excluded[ids]
+    additional &= _rank_in_group(additional, group, starts) < max_additional
+
+    genders = []
+    for gender in ("1girl", "1boy"):
+        found = np.zeros(n, bool)
+        if gender in tag_id:
+            found[group[frequent & (ids == tag_id[gender])]] = True
+        genders.append((gender, found))
+
+    def split(mask: np.ndarray) -> List[np.ndarray]:
+        return np.split(ids[mask], np.searchsorted(group[mask], np.arange(1, n)))
+
+    results = {}
+    for i, (character, related_ids, additional_ids) in enumerate(zip(matrix.characters, split(related),
+                                                                      split(additional))):
+        final = [character]
+        gender = next((g for g, found in genders if found[i]), None)
+        if gender:
+            final.append(gender)
+        final.extend(vocabulary[j] for j in related_ids.tolist())
+        final.extend(vocabulary[j] for j in additional_ids.tolist())
+        results[character] = ", ".join(dict.fromkeys(final))
+    return results
@@ -0,0 +1,374 @@
+"""
+Precomputed character tag profiles.
+
+The builder crawls the whole character list offline and writes a compact
+index that PromptSceneGenerator memory-maps to look tags up in O(1),
+without touching the network.
+
+Run from the directory that contains the node pack:
+    python -m Packreator_manager.tag_profiles build [--workers 4] [--rate 2] [--max-age-days 30]
+    python -m Packreator_manager.tag_profiles lookup 2b_(nier:automata)
+
+The crawl also keeps the raw tag counts (see tag_counts.py), so the index
+can be rebuilt with a different tag selection without scraping again:
+    python -m Packreator_manager.tag_profiles reselect [--threshold 0.5] [--related 8] [--additional 2]
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .corpus_cache import FileVersion, corpus_cache, file_version
+from .scraper_client import scrape_in_process
+from .tag_counts import get_tag_count_store, process_all
+
+FILES_DIR = Path(__file__).parent / "files"
+DEFAULT_INDEX = FILES_DIR / "tag_profiles.idx"
+DEFAULT_CHECKPOINT = FILES_DIR / "tag_profiles.jsonl"
+DEFAULT_COUNTS = FILES_DIR / "tag_counts.sqlite3"
+
+_MAGIC = b"PKTP"
+_HEADER = struct.Struct("<4sIIId")     # magic, version, slot count, entry count, build time
+_SLOT = struct.Struct("<QII")          # key hash, record offset, record length
+_RECORD = struct.Struct("<dHI")        # fetched_at, key length, tags length
+_VERSION = 1
+
+
+def _hash_key(key: bytes) -> int:
+    """Stable 64-bit hash of a character tag; 0 marks an empty slot."""
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def write_index(entries: Dict[str, Tuple[str, float]], path: Union[str, Path]) -> None:
+    """
+    Write an open-addressing hash index of character profiles.
+
+    Args:
+        entries: Mapping of character tag to (tags, fetched_at)
+        path: Destination file, replaced atomically
+    """
+    path = Path(path)
+    n_slots = 1
+    while n_slots < max(8, len(entries) * 2):
+        n_slots *= 2
+
+    slots = [(0, 0, 0)] * n_slots
+    data = bytearray()
+    data_start = _HEADER.size + n_slots * _SLOT.size
+    for character, (tags, fetched_at) in entries.items():
+        key = character.encode("utf-8")
+        value = tags.encode("utf-8")
+        record = _RECORD.pack(fetched_at, len(key), len(value)) + key + value
+        h = _hash_key(key)
+        i = h & (n_slots - 1)
+        while slots[i][0]:
+            i = (i + 1) & (n_slots - 1)
+        slots[i] = (h, data_start + len(data), len(record))
+        data += record
+
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, n_slots, len(entries), time.time()))
+        for slot in slots:
+            f.write(_SLOT.pack(*slot))
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class TagProfileIndex:
+    """Read-only, memory-mapped view of an index written by write_index."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._n_slots, self.size, self.built_at = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Not a tag profile index: {self.path}")
+
+    def _find(self, character: str) -> Optional[Tuple[float, str]]:
+        key = character.encode("utf-8")
+        h = _hash_key(key)
+        mask = self._n_slots - 1
+        i = h & mask
+        while True:
+            slot_hash, offset, _ = _SLOT.unpack_from(self._map, _HEADER.size + i * _SLOT.size)
+            if not slot_hash:
+                return None
+            if slot_hash == h:
+                fetched_at, key_len, tags_len = _RECORD.unpack_from(self._map, offset)
+                start = offset + _RECORD.size
+                if self._map[start:start + key_len] == key:
+                    tags = self._map[start + key_len:start + key_len + tags_len].decode("utf-8")
+                    return fetched_at, tags
+            i = (i + 1) & mask
+
+    def get(self, character: str) -> Optional[str]:
+        """Return the tags of a character, or None if it is not in the index."""
+        found = self._find(character)
+        return found[1] if found else None
+
+    def __contains__(self, character: str) -> bool:
+        return self._find(character) is not None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        self._map.close()
+
+
+_indexes: Dict[str, Tuple[FileVersion, TagProfileIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_profile_index(path: Union[str, Path]) -> Optional[TagProfileIndex]:
+    """Return the shared index at path, reopened when the file changes; None if missing."""
+    key = str(path)
+    try:
+        version = file_version(path)
+    except FileNotFoundError:
+        return None
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if entry is None or entry[0] != version:
+            entry = _indexes[key] = (version, TagProfileIndex(path))
+        return entry[1]
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def read_checkpoint(path: Union[str, Path]) -> Dict[str, dict]:
+    """Return the latest checkpoint record of every character (later lines win)."""
+    records = {}
+    path = Path(path)
+    if not path.exists():
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut short by an interrupted run
+            records[record["character"]] = record
+    return records
+
+
+def _status(tags: str) -> str:
+    """Status of a scraped profile: "ok" if it has more than 3 tags."""
+    return "ok" if len([t for t in tags.split(",") if t.strip()]) > 3 else "insufficient"
+
+
+def _compact_checkpoint(records: Dict[str, dict], path: Path) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        for record in records.values():
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+
+
+def build_profiles(characters: Iterable[str],
+                   checkpoint_path: Union[str, Path] = DEFAULT_CHECKPOINT,
+                   index_path: Union[str, Path] = DEFAULT_INDEX,
+                   scrape: Optional[Callable[[str], str]] = None,
+                   workers: int = 4,
+                   rate: float = 2.0,
+                   max_age: Optional[float] = None,
+                   retry_failed: bool = False,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, int]:
+    """
+    Crawl the tag profiles of many characters and write the index.
+
+    Every result is appended to the checkpoint as soon as it arrives, so an
+    interrupted run resumes where it stopped. Characters already in the
+    checkpoint are skipped unless their entry is older than max_age (or it
+    failed and retry_failed is set), which makes refreshes incremental.
+
+    Args:
+        characters: Character tags to crawl
+        checkpoint_path: JSONL file with one record per crawled character
+        index_path: Destination of the memory-mappable index
+        scrape: Function returning the tags of a character. Defaults to the
+            in-process Danbooru scraper with a 30 s timeout, which also keeps
+            the raw tag counts in DEFAULT_COUNTS (see reselect_profiles).
+        workers: Maximum number of concurrent scrapes
+        rate: Maximum number of scrapes started per second
+        max_age: Re-crawl entries fetched more than this many seconds ago
+        retry_failed: Re-crawl characters whose last attempt failed
+        progress: Called with (done, total) after each scrape
+
+    Returns:
+        Counters of scraped, failed, skipped and indexed characters
+    """
+    if scrape is None:
+        scraper_path = FILES_DIR / "danbooru_scraper.py"
+        counts = get_tag_count_store(DEFAULT_COUNTS)
+        scrape = lambda character: scrape_in_process(
+            scraper_path, character, 3, 30,
+            on_counts=lambda tag_counts, posts: counts.record(character, tag_counts, posts))
+    checkpoint_path = Path(checkpoint_path)
+    records = read_checkpoint(checkpoint_path)
+    now = time.time()
+
+    def needs_crawl(character: str) -> bool:
+        record = records.get(character)
+        if record is None:
+            return True
+        if record["status"] != "ok":
+            return retry_failed
+        return max_age is not None and now - record["fetched_at"] > max_age
+
+    characters = list(dict.fromkeys(characters))
+    pending = [c for c in characters if needs_crawl(c)]
+    stats = {"scraped": 0, "failed": 0, "skipped": len(characters) - len(pending)}
+    limiter = RateLimiter(rate)
+    write_lock = threading.Lock()
+
+    def crawl(character: str) -> dict:
+        limiter.acquire()
+        try:
+            tags = scrape(character)
+        except Exception as e:
+            return {"character": character, "status": "error", "error": str(e), "fetched_at": time.time()}
+        return {"character": character, "status": _status(tags), "tags": tags, "fetched_at": time.time()}
+
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(crawl, character) for character in pending]
+        for done, future in enumerate(as_completed(futures), 1):
+            record = future.result()
+            stats["scraped" if record["status"] == "ok" else "failed"] += 1
+            previous = records.get(record["character"])
+            # A failed refresh keeps the last good profile
+            if record["status"] == "ok" or previous is None or previous["status"] != "ok":
+                with write_lock:
+                    checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+                    records[record["character"]] = record
+            if progress:
+                progress(done, len(pending))
+
+    _compact_checkpoint(records, checkpoint_path)
+    entries = {c: (r["tags"], r["fetched_at"]) for c, r in records.items() if r["status"] == "ok"}
+    write_index(entries, index_path)
+    stats["indexed"] = len(entries)
+    return stats
+
+
+def reselect_profiles(counts_path: Union[str, Path] = DEFAULT_COUNTS,
+                      index_path: Union[str, Path] = DEFAULT_INDEX,
+                      **selection) -> Dict[str, int]:
+    """
+    Rewrite the index from stored tag counts, selecting the tags again without scraping.
+
+    The checkpoint is left alone, so a later build starts from the profiles
+    as they were scraped.
+
+    Args:
+        counts_path: Tag count store filled by in-process scrapes
+        index_path: Destination of the memory-mappable index
+        **selection: Selection parameters of tag_counts.process_all
+            (keywords, excluded, threshold, max_related, max_additional)
+
+    Returns:
+        Counters of characters with stored counts and indexed characters
+    """
+    matrix = get_tag_count_store(counts_path).load()
+    selected = process_all(matrix, **selection)
+    entries = {character: (selected[character], float(fetched_at))
+               for character, fetched_at in zip(matrix.characters, matrix.fetched_at)
+               if _status(selected[character]) == "ok"}
+    write_index(entries, index_path)
+    return {"characters": len(matrix.characters), "indexed": len(entries)}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or query the character tag profile index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="crawl the character list and write the index")
+    build.add_argument("--characters", default=str(FILES_DIR / "440028Already29.txt"))
+    build.add_argument("--checkpoint", default=str(DEFAULT_CHECKPOINT))
+    build.add_argument("--index", default=str(DEFAULT_INDEX))
+    build.add_argument("--workers", type=int, default=4)
+    build.add_argument("--rate", type=float, default=2.0, help="characters started per second")
+    build.add_argument("--max-age-days", type=float, default=None, help="re-crawl older entries")
+    build.add_argument("--retry-failed", action="store_true")
+
+    lookup = sub.add_parser("lookup", help="print the indexed tags of characters")
+    lookup.add_argument("--index", default=str(DEFAULT_INDEX))
+    lookup.add_argument("characters", nargs="+")
+
+    reselect = sub.add_parser("reselect", help="rewrite the index from the stored tag counts, without scraping")
+    reselect.add_argument("--counts", default=str(DEFAULT_COUNTS))
+    reselect.add_argument("--index", default=str(DEFAULT_INDEX))
+    reselect.add_argument("--threshold", type=float, default=0.5, help="share of posts a frequent tag is in")
+    reselect.add_argument("--related", type=int, default=8, help="maximum keyword tags")
+    reselect.add_argument("--additional", type=int, default=2, help="maximum other tags")
+    reselect.add_argument("--keywords", default=None, help="comma-separated keywords (default: the scraper's)")
+    reselect.add_argument("--excluded", default=None, help="regex of excluded tags (default: the scraper's)")
+
+    args = parser.parse_args(argv)
+    if args.command == "lookup":
+        index = TagProfileIndex(args.index)
+        for character in args.characters:
+            print(f"{character}: {index.get(character)}")
+        return
+    if args.command == "reselect":
+        started = time.monotonic()
+        stats = reselect_profiles(
+            args.counts, args.index,
+            keywords=None if args.keywords is None else [k.strip() for k in args.keywords.split(",") if k.strip()],
+            excluded=args.excluded,
+            threshold=args.threshold,
+            max_related=args.related,
+            max_additional=args.additional,
+        )
+        print(", ".join(f"{k}: {v}" for k, v in stats.items()) + f" in {time.monotonic() - started:.2f} s")
+        return
+
+    started = time.monotonic()
+
+    def progress(done: int, total: int) -> None:
+        if done % 25 == 0 or done == total:
+            elapsed = time.monotonic() - started
+            print(f"{done}/{total} characters, {done / elapsed:.2f}/s")
+
+    stats = build_profiles(
+        corpus_cache.get_lines(args.characters),
+        checkpoint_path=args.checkpoint,
+        index_path=args.index,
+        workers=args.workers,
+        rate=args.rate,
+        max_age=None if args.max_age_days is None else args.max_age_days * 86400,
+        retry_failed=args.retry_failed,
+        progress=progress,
+    )
+    print(", ".join(f"{k}: {v}" for k, v in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
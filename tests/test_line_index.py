@@ -0,0 +1,9 @@
+from ..benchmarks.bench_suite import large_corpus
+from ..corpus_cache import _read_lines
+from ..line_index import MappedLines
+
+
+def test_mapped_lines_match_the_tuple(tmp_path):
+    path = tmp_path / "middle.txt"
+    large_corpus(path, 5000)
+    assert list(MappedLines(path)) == list(_read_lines(str(path)))
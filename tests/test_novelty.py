@@ -0,0 +1,22 @@
+import random
+
+import pytest
+
+from ..line_sampler import LineSampler
+from ..novelty import Bitset
+
+
+@pytest.mark.parametrize("weighted", [False, True])
+def test_sampler_does_not_repeat_lines_until_the_pool_resets(weighted, lines=101, calls=200):
+    weights = {i: (i % 5) / 2 for i in range(lines)} if weighted else None
+    sampler = LineSampler(list(range(lines)), weights)
+    used = Bitset(len(sampler))
+    rng = random.Random(0)
+    seen = set()
+    for _ in range(calls):
+        drawn = sampler.sample(rng.randint(1, 9), rng, used)
+        if len(used) <= len(drawn):
+            seen.clear()  # The pool was reset during this call
+        assert len(set(drawn)) == len(drawn)
+        assert not seen.intersection(drawn)
+        seen.update(drawn)
@@ -0,0 +1,46 @@
+import threading
+import time
+
+import pytest
+
+from ..benchmarks.bench_suite import CHARACTER, FILES, _FaultyHandler, stub_danbooru
+from ..scraper_client import load_scraper
+
+
+@pytest.fixture
+def scraper(monkeypatch):
+    """The in-process scraper pointed at the recorded pages, without rate limiting."""
+    scraper = load_scraper(FILES / "danbooru_scraper.py")
+    _FaultyHandler.p429 = _FaultyHandler.p503 = 0.0
+    with stub_danbooru(_FaultyHandler) as url:
+        monkeypatch.setattr(scraper, "BASE_URL", url)
+        monkeypatch.setattr(scraper.limiter, "rate", 0)
+        scraper.breaker.reset()
+        try:
+            yield scraper
+        finally:
+            scraper.breaker.reset()
+
+
+def test_json_backend_selects_the_html_tags(scraper):
+    html_tags = scraper.process_tags(scraper.scrape_page(CHARACTER, 1), CHARACTER)
+    assert scraper.process_tags(scraper.scrape_page_json(CHARACTER, 1), CHARACTER) == html_tags
+
+
+def test_json_backend_rejects_an_error_body(scraper):
+    with pytest.raises(scraper.ScrapeError):
+        scraper.scrape_page_json("__error__", 1)
+
+
+def test_cancelled_probe_does_not_keep_the_circuit_open(scraper, monkeypatch):
+    breaker = scraper.breaker
+    monkeypatch.setattr(breaker, "cooldown", 0.01)
+    for _ in range(breaker.threshold):
+        breaker.failure()
+    time.sleep(0.02)
+    cancelled = threading.Event()
+    cancelled.set()
+    with pytest.raises(scraper.ScrapeCancelled):
+        scraper.fetch(f"{scraper.BASE_URL}/posts?page=1", cancel=cancelled)
+    assert scraper.fetch(f"{scraper.BASE_URL}/posts?page=1")
+    assert breaker.state == "closed"
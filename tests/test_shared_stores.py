@@ -0,0 +1,20 @@
+from ..character_health import get_character_health
+from ..tag_cache import get_tag_cache
+
+
+def test_tag_cache_instances_keep_their_ttl(tmp_path):
+    path = tmp_path / "character_tags.sqlite3"
+    day = get_tag_cache(path, 24 * 60 * 60)
+    hour = get_tag_cache(path, 60 * 60)
+    assert day is not hour
+    assert (day.ttl, hour.ttl) == (24 * 60 * 60, 60 * 60)
+    assert get_tag_cache(path, 24 * 60 * 60) is day
+
+
+def test_health_stores_keep_their_failure_ttl(tmp_path):
+    path = tmp_path / "character_health.sqlite3"
+    day = get_character_health(path, 24 * 60 * 60)
+    hour = get_character_health(path, 60 * 60)
+    assert day is not hour
+    assert (day.failure_ttl, hour.failure_ttl) == (24 * 60 * 60, 60 * 60)
+    assert get_character_health(path, 24 * 60 * 60) is day
@@ -0,0 +1,28 @@
+import sqlite3
+
+from ..tag_cache import CharacterTagCache
+
+
+def test_entries_are_keyed_by_pages_and_source(tmp_path):
+    cache = CharacterTagCache(tmp_path / "character_tags.sqlite3")
+    cache.set("saber_(fate)", "1girl, blonde_hair, ahoge, armor", 3)
+    assert cache.get("saber_(fate)", 3) == "1girl, blonde_hair, ahoge, armor"
+    assert cache.get("saber_(fate)", 3, source="json") is None
+    assert cache.get("saber_(fate)", 6, source="adaptive") is None
+    cache.set("saber_(fate)", "1girl, armor", 6, source="adaptive")
+    assert cache.get("saber_(fate)", 3) == "1girl, blonde_hair, ahoge, armor"
+    assert cache.get("saber_(fate)", 6, source="adaptive") == "1girl, armor"
+
+
+def test_entries_without_a_source_are_dropped(tmp_path):
+    path = tmp_path / "character_tags.sqlite3"
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE character_tags (character TEXT NOT NULL, pages INTEGER NOT NULL,"
+                 " tags TEXT NOT NULL, stored_at REAL NOT NULL, PRIMARY KEY (character, pages))")
+    conn.execute("INSERT INTO character_tags VALUES ('saber_(fate)', 3, '1girl', 0)")
+    conn.commit()
+    conn.close()
+    cache = CharacterTagCache(path, ttl=None)
+    assert cache.get("saber_(fate)", 3) is None
+    cache.set("saber_(fate)", "1girl, armor", 3)
+    assert cache.get("saber_(fate)", 3) == "1girl, armor"
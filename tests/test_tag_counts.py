@@ -0,0 +1,16 @@
+from ..benchmarks.bench_suite import FILES, fill_tag_counts
+from ..scraper_client import load_scraper
+from ..tag_counts import TagCountStore, process_all
+
+
+def test_process_all_selects_the_tags_of_process_counts(tmp_path):
+    scraper = load_scraper(FILES / "danbooru_scraper.py")
+    store = TagCountStore(tmp_path / "tag_counts.sqlite3")
+    try:
+        names = fill_tag_counts(store, scraper, 200)
+        bulk = process_all(store.load())
+        for character in names:
+            counter, posts = store.get(character)
+            assert bulk[character] == scraper.process_counts(counter, posts, character)
+    finally:
+        store.close()
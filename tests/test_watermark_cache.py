@@ -0,0 +1,36 @@
+import math
+
+import numpy as np
+
+from ..benchmarks.bench_suite import FILES, decode_each_time, to_float
+from ..watermark_cache import COMMON_RESOLUTIONS, WatermarkCache
+from ..watermark_node import WatermarkLogoNode
+
+LOGO = sorted(FILES.glob("*_watermark.png"))[0]
+
+
+def premultiplied(rgba):
+    """Colors weighted by alpha: the RGB of transparent pixels is not visible."""
+    return np.concatenate([rgba[..., :3] * rgba[..., 3:], rgba[..., 3:]], axis=-1)
+
+
+def test_logos_are_read_only():
+    assert not WatermarkCache().get(LOGO, COMMON_RESOLUTIONS[0]).flags.writeable
+
+
+def test_cache_stays_within_its_budget():
+    cache = WatermarkCache(max_bytes=8 * 1024 * 1024)
+    cache.get(LOGO, COMMON_RESOLUTIONS[0])
+    cache.get(LOGO)
+    assert cache.nbytes <= cache.max_bytes
+
+
+def test_cached_logo_matches_a_full_decode_and_resize():
+    target = COMMON_RESOLUTIONS[0]
+    for path in sorted(FILES.glob("*_watermark.png")):
+        cached = WatermarkCache(convert=to_float).get(path, target)
+        assert np.allclose(premultiplied(cached), premultiplied(decode_each_time(path, target)), atol=6 / 255)
+
+
+def test_missing_logo_forces_a_run():
+    assert math.isnan(WatermarkLogoNode.IS_CHANGED(str(LOGO.with_name("missing.png")), "original"))
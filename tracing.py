@@ -0,0 +1,213 @@
+"""
+Opt-in per-stage timing trace.
+
+Set PACKREATOR_TRACE to a file path (or call enable(path)) and every span
+opened with ``span(name, **attrs)`` is appended to it as one JSON line
+with its duration, thread, parent span and attributes. While tracing is
+off, ``span`` returns a shared no-op object, so instrumented code costs a
+function call and an attribute check.
+
+Summarize a trace with p50/p95 per stage:
+    python -m Packreator_manager.tracing files/trace.jsonl
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from contextvars import ContextVar, copy_context
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union
+
+_current: ContextVar[Optional[int]] = ContextVar("packreator_span", default=None)
+_ids = itertools.count(1)
+
+
+class _NullSpan:
+    """Returned by span() while tracing is off."""
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _TraceWriter:
+    """Appends span records to a JSONL file, one line per write."""
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Span:
+    """A timed stage; attributes can be added with set() until it ends."""
+
+    __slots__ = ("name", "attrs", "id", "parent", "_writer", "_token", "_start", "_wall")
+
+    def __init__(self, writer: _TraceWriter, name: str, attrs: Dict[str, Any]):
+        self._writer = writer
+        self.name = name
+        self.attrs = attrs
+        self.id = next(_ids)
+        self.parent = None
+
+    def __enter__(self) -> "Span":
+        self.parent = _current.get()
+        self._token = _current.set(self.id)
+        self._wall = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        duration = time.perf_counter() - self._start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self._writer.write({
+            "span": self.name,
+            "id": self.id,
+            "parent": self.parent,
+            "start": round(self._wall, 6),
+            "ms": round(duration * 1000, 3),
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            **self.attrs,
+        })
+        return False
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+_writer: Optional[_TraceWriter] = None
+
+
+def enable(path: Union[str, Path]) -> None:
+    """Start appending spans to path."""
+    global _writer
+    disable()
+    _writer = _TraceWriter(path)
+
+
+def disable() -> None:
+    """Stop tracing and close the trace file."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+def enabled() -> bool:
+    return _writer is not None
+
+
+def span(name: str, **attrs: Any):
+    """
+    Time a stage as a context manager.
+
+    Args:
+        name: Stage name, dotted by component (e.g. 'scraper.fetch')
+        attrs: Attributes recorded with the span
+
+    Returns:
+        A Span, or a shared no-op span while tracing is off
+    """
+    writer = _writer
+    if writer is None:
+        return NULL_SPAN
+    return Span(writer, name, attrs)
+
+
+T = TypeVar("T")
+
+
+def propagate(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    Bind fn to the caller's context, for work handed to a thread pool.
+
+    Worker threads start with an empty context, so spans they open would
+    have no parent. Each call of the returned function runs fn in its own
+    copy of the context captured here, so it can run in several threads at once.
+    """
+    context = copy_context()
+
+    def run(*args: Any, **kwargs: Any) -> T:
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+
+def summarize(path: Union[str, Path]) -> Dict[str, Dict[str, float]]:
+    """
+    Aggregate a trace file per stage.
+
+    Returns:
+        Mapping of span name to count, p50, p95, max and total milliseconds
+    """
+    durations: Dict[str, List[float]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut short by a crash
+            durations.setdefault(record["span"], []).append(record["ms"])
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+            "max": values[-1],
+            "total": sum(values),
+        }
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Summarize a span trace per stage.")
+    parser.add_argument("trace")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = summarize(args.trace)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{'stage':36s} {'count':>7s} {'p50 ms':>10s} {'p95 ms':>10s} {'max ms':>10s} {'total ms':>11s}")
+    for name, s in sorted(summary.items(), key=lambda item: -item[1]["total"]):
+        print(f"{name:36s} {s['count']:7d} {s['p50']:10.2f} {s['p95']:10.2f} {s['max']:10.2f} {s['total']:11.1f}")
+
+
+if os.environ.get("PACKREATOR_TRACE"):
+    enable(os.environ["PACKREATOR_TRACE"])
+
+
+if __name__ == "__main__":
+    main()
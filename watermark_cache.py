@@ -0,0 +1,156 @@
+"""
+Decoded organization logos, shared by every watermarking step.
+
+The watermark PNGs are large (lovehent's is 5120x3515), so decoding and
+resizing them once per image dominates a pack's watermark step. The cache
+decodes each logo once per file version and keeps it, together with its
+resized variants, in a byte-bounded LRU.
+
+Decoded logos are kept with premultiplied alpha ("RGBa"): PIL premultiplies
+RGBA images on every resize anyway, which on the full-size logo costs more
+than the resize itself.
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from .corpus_cache import FileVersion, file_version
+from .tracing import span
+
+# Output resolutions of our packs (SDXL buckets), portrait and landscape
+COMMON_RESOLUTIONS = (
+    (832, 1216), (1216, 832),
+    (896, 1152), (1152, 896),
+    (768, 1344), (1344, 768),
+    (1024, 1024),
+)
+
+Size = Tuple[int, int]
+
+
+def fit_size(size: Size, target: Size) -> Size:
+    """Largest size with the aspect ratio of size that fits inside target."""
+    scale = min(target[0] / size[0], target[1] / size[1])
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+
+def to_array(image: Image.Image) -> np.ndarray:
+    """Default conversion: read-only HxWx4 uint8 RGBA array."""
+    array = np.asarray(image)
+    array.flags.writeable = False
+    return array
+
+
+class WatermarkCache:
+    """
+    Byte-bounded LRU of decoded logos and their resized variants.
+
+    Entries are keyed by path, file version and target size, so a replaced
+    logo file is decoded again and its old entries age out. The bytes held
+    never exceed ``max_bytes``: a value larger than the whole budget is
+    returned without being cached.
+
+    Values are produced by ``convert`` from an RGBA PIL image and shared
+    between callers, so they must not be modified; the default conversion
+    returns read-only arrays to enforce it. Callers that need a writable
+    value, like WatermarkLogoNode with torch tensors, copy it.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024,
+                 convert: Callable[[Image.Image], Any] = to_array,
+                 sizeof: Callable[[Any], int] = lambda value: value.nbytes):
+        """
+        Args:
+            max_bytes: Memory budget of the cached values and decoded logos
+            convert: Turns an RGBA image into the cached value
+            sizeof: Size in bytes of a converted value
+        """
+        self.max_bytes = max_bytes
+        self.convert = convert
+        self.sizeof = sizeof
+        self._entries: "OrderedDict[tuple, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "decodes": 0, "resizes": 0}
+
+    def _lookup(self, key: tuple) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def _store(self, key: tuple, value: Any, nbytes: int) -> None:
+        with self._lock:
+            if key in self._entries or nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def _decoded(self, path: str, version: FileVersion) -> Image.Image:
+        key = ("decoded", path, version)
+        image = self._lookup(key)
+        if image is None:
+            with span("watermark.decode", path=path):
+                with Image.open(path) as source:
+                    image = source.convert("RGBA").convert("RGBa")
+            self.stats["decodes"] += 1
+            self._store(key, image, image.width * image.height * 4)
+        return image
+
+    def get(self, path: Union[str, Path], target: Optional[Size] = None) -> Any:
+        """
+        Return a logo, converted by ``convert``.
+
+        Args:
+            path: Logo image file
+            target: (width, height) the logo is scaled to fit in, keeping its
+                aspect ratio; None for the original size
+
+        Returns:
+            The converted logo
+        """
+        path = os.fspath(path)
+        version = file_version(path)
+        key = ("variant", path, version, target)
+        value = self._lookup(key)
+        if value is not None:
+            return value
+        image = self._decoded(path, version)
+        if target is not None:
+            size = fit_size(image.size, target)
+            if size != image.size:
+                # A reducing gap of 3 is indistinguishable from a full Lanczos
+                # pass (within 5/255 on our logos) and several times faster
+                with span("watermark.resize", path=path, width=size[0], height=size[1]):
+                    image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+                self.stats["resizes"] += 1
+        value = self.convert(image.convert("RGBA"))
+        self._store(key, value, self.sizeof(value))
+        return value
+
+    def warm(self, path: Union[str, Path], targets: Iterable[Optional[Size]] = COMMON_RESOLUTIONS) -> None:
+        """Decode a logo and build its variants for targets ahead of use."""
+        for target in targets:
+            self.get(path, target)
+
+    def clear(self) -> None:
+        """Drop every cached logo."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes currently held by the cache."""
+        return self._bytes
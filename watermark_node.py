@@ -0,0 +1,90 @@
+import os
+from typing import Tuple
+
+import numpy as np
+
+from .corpus_cache import file_version
+from .watermark_cache import COMMON_RESOLUTIONS, WatermarkCache
+
+RESOLUTION_CHOICES = ["original", "match image"] + [f"{w}x{h}" for w, h in COMMON_RESOLUTIONS]
+
+
+def _to_tensors(image):
+    """RGBA PIL image -> (IMAGE [1, H, W, 3], MASK [1, H, W]) tensors, as LoadImage outputs them."""
+    import torch  # Provided by ComfyUI; not needed to import the rest of the pack
+
+    rgba = torch.from_numpy(np.asarray(image, dtype=np.float32) / 255.0)
+    # Same convention as LoadImage: the mask is 1 where the logo is transparent
+    return rgba[None, :, :, :3].contiguous(), (1.0 - rgba[None, :, :, 3]).contiguous()
+
+
+def _tensors_nbytes(tensors) -> int:
+    return sum(t.element_size() * t.nelement() for t in tensors)
+
+
+class WatermarkLogoNode:
+    """
+    Loads an organization logo (the ``logo`` output of the packreator manager)
+    as IMAGE and MASK, decoding and resizing it once per process instead of
+    once per watermarked image.
+    """
+
+    # Shared by every execution; load_logo hands out copies of the cached tensors
+    _cache = None
+    # Memory budget of the cache. The float32 tensors of a full-size logo
+    # take 16 bytes per pixel (288 MB for lovehent's 5120x3515 "original").
+    MAX_BYTES = 512 * 1024 * 1024
+
+    @classmethod
+    def get_cache(cls) -> WatermarkCache:
+        """Return the shared logo cache, creating it on first use."""
+        if cls._cache is None:
+            cls._cache = WatermarkCache(cls.MAX_BYTES, convert=_to_tensors, sizeof=_tensors_nbytes)
+        return cls._cache
+
+    @classmethod
+    def INPUT_TYPES(s):
+        return {
+            "required": {
+                "logo": ("STRING", {"forceInput": True}),
+                "resolution": (RESOLUTION_CHOICES, {"default": "original"}),
+            },
+            "optional": {
+                "image": ("IMAGE",),
+            }
+        }
+
+    @classmethod
+    def IS_CHANGED(cls, logo, resolution, image=None):
+        # Re-run when the logo file is replaced, not only when the inputs change
+        if not logo:
+            return ""
+        try:
+            return str(file_version(logo))
+        except OSError:
+            return float("nan")  # Never equal: load_logo runs and reports the missing file
+
+    RETURN_TYPES = ("IMAGE", "MASK")
+    RETURN_NAMES = ("logo_image", "logo_mask")
+    FUNCTION = "load_logo"
+    CATEGORY = "image/watermark"
+
+    def target_size(self, resolution: str, image=None):
+        """(width, height) the logo is fitted in, or None for the original size."""
+        if resolution == "match image":
+            if image is None:
+                raise ValueError("resolution 'match image' needs the image input")
+            return int(image.shape[2]), int(image.shape[1])
+        if resolution == "original":
+            return None
+        width, height = resolution.split("x")
+        return int(width), int(height)
+
+    def load_logo(self, logo, resolution, image=None) -> Tuple:
+        """Return the logo fitted in the selected resolution, keeping its aspect ratio."""
+        if not logo:
+            raise ValueError("No logo for this organization")
+        if not os.path.isfile(logo):
+            raise ValueError(f"Logo file not found: {logo}")
+        # Copies: downstream nodes may modify their inputs in place
+        return tuple(tensor.clone() for tensor in self.get_cache().get(logo, self.target_size(resolution, image)))